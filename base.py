@@ -1,11 +1,17 @@
 import asyncio
+import hashlib
+import os
+import threading
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
 from telnetlib import EC
 
 import aiohttp
 from fake_useragent import UserAgent
 from selenium import webdriver
-from selenium.common.exceptions import WebDriverException
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.firefox.options import Options as FirefoxOptions
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -13,40 +19,164 @@ from selenium.webdriver.support import expected_conditions as EC
 from fp.fp import FreeProxy
 from undetected_chromedriver import ChromeOptions
 
-from proxy import get_free_proxy_async
+from classifier import classify, is_rejected, BLOCK_SCAN_BYTES, PAGE_TYPES
+from devtools import drain_network_events, page_traffic, wait_for_xhr_idle, collect_json_responses, \
+    capture_wanted, matches_capture_parser, CAPTURE_MODE
+from page_cache import get_page_cache, cache_key
+from proxy import get_free_proxy_async, proxy_pool
+from ratelimit import limiter
+from retry import retry_policy, BlockedError, BrowserError
+from session_store import load_session, save_session, capture_selenium_state, restore_selenium_state, \
+    http_session_state, drop_session
 
 
 class BrowserRestartException(Exception):
     pass
 
 
-MAX_RETRIES = 100
-global used_proxies
+class Page(NamedTuple):
+    html: Optional[str]
+    status: int
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
 
-used_proxies = []
 
+class ListingPage(NamedTuple):
+    html: str
+    digest: str
+    changed: bool  # False when this version of the page was already fully processed
 
-def get_free_proxy():
-    """Get a free proxy using the FreeProxy library, avoiding used proxies."""
-    while True:
+
+def is_blocked(html):
+    """Detects the 403, access denied and captcha pages the site serves when it blocks us."""
+    return is_rejected(html)
+
+
+# Shared aiohttp session settings
+HTTP_LIMIT = 100  # Total simultaneous connections
+HTTP_LIMIT_PER_HOST = 10  # Simultaneous connections to a single host
+DNS_CACHE_TTL = 300  # Seconds to keep resolved addresses
+KEEPALIVE_TIMEOUT = 30  # Seconds to keep idle connections open
+HTTP_TIMEOUT = 60
+READ_CHUNK_SIZE = 64 * 1024
+
+_session = None
+
+# Readiness detection for Selenium pages
+READY_POLL_INTERVAL = 0.1  # Seconds between readiness checks
+DOM_QUIET_MS = 250  # The DOM must stop changing for this long before we read it
+# Pages the predicate never matches (no size table, a parameter left empty) are read
+# once no spinner is left and the DOM has not changed for this long
+READY_FALLBACK_QUIET_MS = 3000
+
+# Injected into every page, records the time of the latest DOM mutation
+MUTATION_OBSERVER_JS = """
+if (!window.__readyObserver) {
+    window.__lastMutation = performance.now();
+    window.__readyObserver = new MutationObserver(function () {
+        window.__lastMutation = performance.now();
+    });
+    window.__readyObserver.observe(document, {childList: true, subtree: true, characterData: true});
+}
+"""
+
+# Page type -> JS expression that is true once the data we parse is rendered
+READY_PREDICATES = {
+    'trim': """
+        document.querySelector('.market-filter') !== null
+        || (document.querySelector('.data-parameters') !== null
+            && document.querySelector('tbody tr') !== null
+            && document.querySelector('i.fa-spinner') === null
+            && Array.from(document.querySelectorAll('li.element-parameter span[id]'))
+                .every(function (span) { return span.textContent.trim() !== ''; }))
+    """,
+    'listing': "document.readyState === 'complete'",
+}
+
+# Nothing is loading any more, the fallback for pages the predicate does not fit
+SETTLED_PAGE_JS = "document.readyState === 'complete' && document.querySelector('i.fa-spinner') === null"
+
+# Block pages never satisfy a predicate, so let them through to is_blocked right away
+BLOCKED_PAGE_JS = "/403 Forbidden|access denied/i.test(document.title)"
+
+
+# Lean browsing: resources Chrome never requests, blocked through CDP
+LEAN_MODE = True
+BLOCKED_URL_PATTERNS = [
+    # Images, fonts, stylesheets and media
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot', '*.css', '*.mp4', '*.webm',
+    # Ads and trackers
+    '*googletagmanager.com*', '*google-analytics.com*', '*doubleclick.net*',
+    '*googlesyndication.com*', '*adservice.google.*', '*amazon-adsystem.com*',
+    '*facebook.net*', '*hotjar.com*', '*scorecardresearch.com*', '*quantserve.com*',
+]
+# Persistent disk caches for the scripts that still load, leased to drivers by the pool
+BROWSER_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.browser_cache')
+BROWSER_CACHE_SIZE = 200 * 1024 * 1024
+
+# Bytes transferred and served from cache, blocked request count, summed over all pages
+traffic_stats = Counter()
+_traffic_lock = threading.Lock()  # Pages report from the browser threads
+
+BROWSER_THREADS = 3  # Default size of the Selenium executor, BrowserPool resizes it
+_browser_executor = None
+
+
+PROXY_DISCOVERY_ATTEMPTS = 5
+
+
+def get_free_proxy(attempts=PROXY_DISCOVERY_ATTEMPTS):
+    """Get a free proxy using the FreeProxy library, giving up after a few attempts."""
+    for _ in range(attempts):
         try:
             country_ids = ['US', 'CA', 'FR', 'DE', 'GB', 'NL', 'SE', 'IT', 'UK']
 
             proxy = FreeProxy(rand=True,country_id=country_ids).get()
-            if proxy and proxy not in used_proxies:
+            if proxy:
                 print(f"Got a proxy: {proxy}")
-                used_proxies.append(proxy)
                 return proxy
             print("Failed to get a valid proxy. Trying again...")
         except Exception as e:
             print(f"Failed to get a proxy: {e}")
-            continue
+    return None
+
+
+async def create_browser(proxy=None, cache_dir=None):
+    """Starts a Chrome driver in a worker thread so the event loop keeps running."""
+    return await asyncio.to_thread(build_browser, proxy, cache_dir)
+
 
+async def close_browser(driver, session='save'):
+    """Quits the driver in a worker thread, ignoring drivers that already died.
 
-async def create_browser(proxy=None):
+    session tells what happens to the proxy's saved session: 'save' stores
+    the driver's, 'drop' deletes it after a block, 'keep' leaves it as is.
+    """
+    if driver is None:
+        return
+    if session == 'save':
+        try:
+            state = await asyncio.to_thread(capture_selenium_state, driver)
+            save_session(getattr(driver, 'proxy', None), state)
+        except Exception as e:
+            print(f"Failed to save browser session: {e}")
+    elif session == 'drop':
+        drop_session(getattr(driver, 'proxy', None))
+    try:
+        await asyncio.to_thread(driver.quit)
+    except Exception as e:
+        print(f"Failed to close browser: {e}")
+
+
+def build_browser(proxy=None, cache_dir=None):
     """Setup Selenium driver with optional proxy to mimic a real user browser."""
-    ua = UserAgent()
-    user_agent = ua.random
+    session = load_session(proxy)  # Cookies, localStorage and user agent from earlier drivers
+    if session and session.get('user_agent'):
+        user_agent = session['user_agent']
+    else:
+        ua = UserAgent()
+        user_agent = ua.random
 
     options = ChromeOptions()
     options.add_argument(f"user-agent={user_agent}")
@@ -67,67 +197,343 @@ async def create_browser(proxy=None):
     if proxy:
         options.add_argument(f'--proxy-server={proxy}')
 
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        options.add_argument(f"--disk-cache-dir={cache_dir}")
+        options.add_argument(f"--disk-cache-size={BROWSER_CACHE_SIZE}")
+
+    if LEAN_MODE:
+        options.add_argument("--blink-settings=imagesEnabled=false")
+    if LEAN_MODE or CAPTURE_MODE:
+        # Network events in the performance log feed page_traffic and the XHR capture
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    if CAPTURE_MODE:
+        # driver.get returns at DOMContentLoaded, the XHR capture decides when the page is done
+        options.page_load_strategy = 'eager'
+
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option('useAutomationExtension', False)
 
     driver = webdriver.Chrome(options=options)
+    driver.proxy = proxy  # Lets the rate limiter key on the driver's proxy
+    driver.cache_dir = cache_dir
+    driver.user_agent = user_agent
+    driver.network_events = []
+
+    if LEAN_MODE or CAPTURE_MODE:
+        driver.execute_cdp_cmd('Network.enable', {})
+    if LEAN_MODE:
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+    if session:
+        restore_selenium_state(driver, session)
     return driver
 
 
-async def get(driver, url, semaphore, timeout=30, max_retries=MAX_RETRIES,
-              element_to_wait_for="//li[@class='element-parameter']//div[@data-title='Thread Size']//span[@id]"):
+def report_traffic(driver, url):
+    traffic = page_traffic(drain_network_events(driver))
+    with _traffic_lock:
+        traffic_stats.update(traffic)
+        traffic_stats['pages'] += 1
+    print(f"Traffic for {url}: {traffic['transferred'] // 1024} KB transferred, "
+          f"{traffic['from_cache'] // 1024} KB saved by the cache, {traffic['blocked']} requests blocked")
+
+
+def print_traffic_stats():
+    pages = traffic_stats['pages']
+    if not pages:
+        return
+    print(f"Browser traffic over {pages} pages: "
+          f"{traffic_stats['transferred'] / pages / 1024:.0f} KB transferred per page, "
+          f"{traffic_stats['from_cache'] / pages / 1024:.0f} KB per page saved by the cache, "
+          f"{traffic_stats['blocked'] / pages:.1f} requests per page blocked")
+
+
+def ready_expression(page_type='trim'):
+    """JS expression that is true once a page of page_type can be read, shared by both engines.
+
+    Needs MUTATION_OBSERVER_JS injected into the page first.
+    """
+    predicate = READY_PREDICATES.get(page_type, READY_PREDICATES['listing'])
+    quiet = "performance.now() - window.__lastMutation"
+    return (f"(({BLOCKED_PAGE_JS}) || (({predicate}) && {quiet} > {DOM_QUIET_MS}) "
+            f"|| (({SETTLED_PAGE_JS}) && {quiet} > {READY_FALLBACK_QUIET_MS}))")
+
+
+def wait_until_ready(driver, page_type='trim', timeout=30):
+    """Waits for the page type's predicate to hold and the DOM to settle.
+
+    A MutationObserver injected into the page marks every DOM change, so we
+    return as soon as the parameter panels and size tables are rendered
+    instead of sleeping for a fixed time. A page the predicate never matches
+    is taken once it has settled for READY_FALLBACK_QUIET_MS.
+    """
+    driver.execute_script(MUTATION_OBSERVER_JS)
+    script = f"return {ready_expression(page_type)};"
+    WebDriverWait(driver, timeout, poll_frequency=READY_POLL_INTERVAL).until(
+        lambda driver: driver.execute_script(script)
+    )
+
+
+async def get(driver, url, semaphore, timeout=30, page_type='trim', policy=None):
     """Uses Selenium to fetch a webpage, handles proxy changes on '403 Forbidden'."""
-    attempt = 0
-    while attempt < max_retries:
+    cache = get_page_cache()
+    if cache is None:
+        return await render_page(driver, url, timeout, page_type, policy)
+    # Only a render of this url may leave captures behind, a cache hit must not
+    # hand out the responses of the driver's previous page
+    driver.captured_responses = []
+    accept = is_cacheable_render(page_type)
+    # A page stopped after its responses were captured is incomplete, only its captures count
+    return await cache.fetch(url, lambda: render_page(driver, url, timeout, page_type, policy), kind='browser',
+                             accept=lambda html: not driver.captured_responses and accept(html))
+
+
+def is_cacheable_render(page_type):
+    """Returns the check a rendered page must pass before it goes into the page cache.
+
+    A trim page is kept only once it classifies as one of the known layouts,
+    anything else is kept unless it is a block or captcha page. A rejected
+    render left in the cache would be served again on every retry.
+    """
+    if page_type == 'trim':
+        return lambda html: classify(html) in PAGE_TYPES
+    return lambda html: not is_rejected(html)
+
+
+def configure_browser_executor(workers):
+    """Sizes the thread pool that runs blocking Selenium calls, one thread per pooled driver."""
+    global _browser_executor
+    if _browser_executor is not None:
+        _browser_executor.shutdown(wait=False)
+    _browser_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='selenium')
+    return _browser_executor
+
+
+async def run_in_browser_thread(func, *args):
+    """Runs a blocking Selenium call on the browser executor and awaits its result."""
+    if _browser_executor is None:
+        configure_browser_executor(BROWSER_THREADS)
+    return await asyncio.get_running_loop().run_in_executor(_browser_executor, func, *args)
+
+
+def load_page(driver, url, timeout=30, page_type='trim'):
+    """Navigates the driver to url and waits until the page is ready. Blocking."""
+    driver.set_window_size(1920, 1080)
+    driver.pages_served = getattr(driver, 'pages_served', 0) + 1
+    if LEAN_MODE or CAPTURE_MODE:
+        # Drop the events of the previous page
+        drain_network_events(driver)
+        driver.network_events = []
+    driver.captured_responses = []
+    driver.get(url)
+
+    captured = []
+    if CAPTURE_MODE and capture_wanted():
+        # scroll to the bottom of the page to load all elements
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        wait_for_xhr_idle(driver, timeout)
+        captured = collect_json_responses(driver)
+    if captured and matches_capture_parser(captured):
+        # The data is in, whatever is still loading is not needed and the DOM is never parsed
+        driver.execute_script("window.stop();")
+        driver.captured_responses = captured
+    else:
+        WebDriverWait(driver, timeout, poll_frequency=READY_POLL_INTERVAL).until(
+            lambda driver: driver.execute_script("return document.readyState") == "complete"
+        )
+
+        # scroll to the bottom of the page to load all elements
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+
+        wait_until_ready(driver, page_type, timeout)
+
+    if LEAN_MODE:
+        report_traffic(driver, url)
+
+    return driver.page_source
+
+
+async def render_page(driver, url, timeout=30, page_type='trim', policy=None):
+    """Loads url in the driver and returns the rendered page source.
+
+    The blocking Selenium work runs on the browser executor, so HTTP fetches
+    and DB writes keep going while Chrome renders. A page that never gets
+    ready counts as a driver failure, so it is not retried on the same
+    driver. Blocks and driver failures surface as BrowserRestartException.
+    """
+    policy = policy or retry_policy
+    proxy = getattr(driver, 'proxy', None)
+
+    async def load():
+        await limiter.acquire(url, proxy)
+        started = time.monotonic()
         try:
-            driver.set_window_size(1920, 1080)
-            driver.get(url)
-            WebDriverWait(driver, timeout).until(
-                lambda driver: driver.execute_script("return document.readyState") == "complete"
-            )
-
-            # Conditions to wait for
-            region_message_xpath = "//div[contains(@class, 'item flex-auto') and contains(text(), 'Specify the region of sale to narrow your search:')]"
-            spinner_xpath = "//i[contains(@class, 'fa-spinner')]"
-
-            # scroll to the bottom of the page to load all elements
-
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-
-            WebDriverWait(driver, timeout).until(
-                EC.any_of(
-                    EC.presence_of_element_located((By.XPATH, region_message_xpath)),
-                    EC.invisibility_of_element_located((By.XPATH, spinner_xpath))
-                )
-            )
-
-            WebDriverWait(driver, 5).until(
-                lambda driver: time.time(),
-            )
-
-            page_source = driver.page_source
-            if "403 Forbidden" in page_source or "access denied" in page_source.lower():
-                raise BrowserRestartException("403 Forbidden detected. Changing proxy...")
+            if hasattr(driver, 'fetch_html'):
+                # Async engines such as PlaywrightContext load pages themselves
+                page_source = await driver.fetch_html(url, timeout, page_type)
             else:
-                return page_source
-        except WebDriverException as e:
-            print(f"WebDriverException encountered: {e}")
-            raise BrowserRestartException("WebDriverException encountered. Changing proxy...")
-        attempt += 1
-        await asyncio.sleep(1)
-    print("Max retries reached. Failed to fetch the page.")
-    return None
+                page_source = await run_in_browser_thread(load_page, driver, url, timeout, page_type)
+        except (TimeoutException, asyncio.TimeoutError) as e:
+            # Most likely a stuck driver, swap it right away instead of waiting it out again
+            raise BrowserError(f"Page not ready after {timeout}s: {url}") from e
+        if is_blocked(page_source):
+            limiter.blocked(url, proxy)
+            await proxy_pool.ban(proxy)
+            raise BlockedError(f"Access denied for {url}")
+        limiter.success(url, proxy)
+        await proxy_pool.report_success(proxy, time.monotonic() - started)
+        return page_source
+
+    try:
+        return await policy.run(url, proxy, load)
+    except BlockedError as e:
+        raise BrowserRestartException("403 Forbidden detected. Changing proxy...") from e
+    except (WebDriverException, BrowserError) as e:
+        print(f"WebDriverException encountered: {e!r}")
+        await proxy_pool.report_failure(proxy)
+        raise BrowserRestartException("WebDriverException encountered. Changing proxy...") from e
+
+
+def get_session():
+    """Returns the crawler-wide aiohttp session, creating it on first use."""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_LIMIT,
+            limit_per_host=HTTP_LIMIT_PER_HOST,
+            use_dns_cache=True,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+        )
+    return _session
+
+
+async def close_session():
+    """Closes the shared aiohttp session and its pooled connections."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def fetch_with_retry(url, retries=None, proxy=None, session=None):
+    cache = get_page_cache()
+    if cache is None:
+        return await download(url, retries, proxy, session)
+    return await cache.fetch(url, lambda: download(url, retries, proxy, session))
+
+
+async def download(url, retries=None, proxy=None, session=None):
+    """Fetches url over the shared aiohttp session, retrying on errors."""
+    return (await request_page(url, retries, proxy, session)).html
+
+
+async def request_page(url, retries=None, proxy=None, session=None, headers=None, policy=None):
+    """Fetches url and returns its body with the validators the server sent.
+
+    Errors are retried under the retry policy, at most retries times when
+    given, and the last one is raised. A 304 answer to a conditional request
+    comes back with html set to None.
+    """
+    session = session or get_session()
+    policy = policy or retry_policy
+
+    # Reuse the user agent and clearance cookies browsers earned on this proxy
+    user_agent, cookies = http_session_state(proxy, url)
+    if user_agent:
+        headers = {'User-Agent': user_agent, **(headers or {})}
+
+    async def attempt():
+        await limiter.acquire(url, proxy)
+        started = time.monotonic()
+        print(f"Fetching {url} with proxy {proxy}")
+        try:
+            async with session.get(str(url), proxy=proxy, headers=headers, cookies=cookies) as response:
+                if response.status in (403, 429):
+                    limiter.blocked(url, proxy)
+                    await proxy_pool.ban(proxy)
+                    raise BlockedError(f"{response.status} for {url}")
+                response.raise_for_status()
+                print(f"Response status: {response.status}")
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                if response.status == 304:
+                    html = None
+                else:
+                    body = await read_body(response)
+                    html = body.decode(response.charset or 'utf-8', errors='replace') if body is not None else None
+                    if html is None or is_blocked(html):
+                        limiter.blocked(url, proxy)
+                        await proxy_pool.ban(proxy)
+                        raise BlockedError(f"Access denied for {url}")
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            await proxy_pool.report_failure(proxy)
+            raise
+        limiter.success(url, proxy)
+        await proxy_pool.report_success(proxy, time.monotonic() - started)
+        return Page(html, response.status, etag, last_modified)
+
+    return await policy.run(url, proxy, attempt, max_attempts=retries)
+
+
+async def read_body(response):
+    """Streams a response body, returning None as soon as its head shows a block or captcha page."""
+    body = bytearray()
+    async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+        scanned = len(body)
+        body.extend(chunk)
+        if scanned < BLOCK_SCAN_BYTES and is_rejected(body):
+            return None
+    return body
+
+
+async def fetch_if_changed(url, retries=None, proxy=None, session=None, revalidate=False):
+    """Fetches a listing page and tells whether it changed since it was last processed.
+
+    Fresh cached copies are used as is unless revalidate is set, stale or
+    revalidated ones are checked with If-None-Match / If-Modified-Since.
+    Call remember_page once everything on the page has been stored.
+    """
+    cache = get_page_cache()
+    if cache is None:
+        html = await download(url, retries, proxy, session)
+        return ListingPage(html, hashlib.sha256(html.encode('utf-8')).hexdigest(), True)
+
+    key = cache_key(url)
+    entry = await cache.run(cache.entry, key)
+    html = None
+    if entry and not revalidate and cache.is_fresh(entry[1]):
+        digest = entry[0]
+        html = await cache.run(cache.get, key)
+
+    if html is None:
+        headers = {}
+        if entry and entry[2]:
+            headers['If-None-Match'] = entry[2]
+        if entry and entry[3]:
+            headers['If-Modified-Since'] = entry[3]
+        page = await request_page(url, retries, proxy, session, headers=headers)
+        if page.status == 304:
+            html = await cache.run(cache.get, key, allow_stale=True)
+            if html is not None:
+                digest = entry[0]
+                await cache.run(cache.touch, key)
+            else:
+                # The body was evicted, fetch it again without validators
+                page = await request_page(url, retries, proxy, session)
+        if html is None:
+            html = page.html
+            digest = await cache.run(cache.put, key, html, page.etag, page.last_modified)
+
+    return ListingPage(html, digest, await cache.run(cache.processed_digest, key) != digest)
 
 
-async def fetch_with_retry(url, retries=3, proxy=None):
-    for attempt in range(retries):
-        async with aiohttp.ClientSession() as session:
-            try:
-                print(f"Fetching {url} with proxy {proxy}")
-                async with session.get(url, proxy=proxy) as response:
-                    response.raise_for_status()
-                    print(f"Response status: {response.status}")
-                    return await response.text()
-            except Exception as e:
-                if attempt == retries - 1:
-                    raise Exception(f"Failed to fetch {url} after {retries} attempts")
+async def remember_page(url, page):
+    """Records that everything on this version of the page has been stored."""
+    cache = get_page_cache()
+    if cache is not None:
+        await cache.run(cache.mark_processed, cache_key(url), page.digest)
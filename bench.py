@@ -0,0 +1,83 @@
+import argparse
+import io
+import statistics
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+import soup_parsers
+from parity import saved_pages, parser_for
+from parsers import PARSERS, get_parser
+
+LISTING_PARSERS = ('brands', 'models', 'trims')
+
+# Variant name -> (backend, strain listings)
+VARIANTS = {
+    'soup full': ('soup', False),
+    'soup strained': ('soup', True),
+    'lxml': ('lxml', False),
+}
+
+
+def run_variant(variant, name, html, args):
+    backend, strained = VARIANTS[variant]
+    soup_parsers.STRAIN_LISTINGS = strained
+    with redirect_stdout(io.StringIO()):  # The reference parsers print their progress
+        return get_parser(name, backend)(html, *args)
+
+
+def measure(variant, name, html, args, repeat):
+    """Returns (median seconds, peak bytes allocated) for one page under one variant."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run_variant(variant, name, html, args)
+        timings.append(time.perf_counter() - started)
+
+    # A separate run, tracing allocations would skew the timings. tracemalloc only
+    # sees Python objects, so the lxml peak leaves out the tree libxml2 builds in C
+    tracemalloc.start()
+    try:
+        run_variant(variant, name, html, args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time and memory per page for every parser variant.')
+    parser.add_argument('paths', nargs='*', help='saved pages, the whole page cache when left out')
+    parser.add_argument('--parser', choices=PARSERS, help='parser for the given files, by default picked from the url')
+    parser.add_argument('--all', action='store_true', help='trim pages too, not only listing pages')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per page and variant')
+    args = parser.parse_args(argv)
+
+    strain_listings = soup_parsers.STRAIN_LISTINGS
+    totals = {variant: [0.0, 0] for variant in VARIANTS}
+    pages = 0
+    for label, url, html in saved_pages(args.paths):
+        picked = (args.parser, ()) if args.parser and args.parser != 'trim_page' else parser_for(url, html)
+        if picked is None or (picked[0] not in LISTING_PARSERS and not args.all):
+            continue
+        name, extra = picked
+        html = html.encode('utf-8') if isinstance(html, str) else html
+        pages += 1
+        print(f'{label} [{name}, {len(html) / 1024:.0f} KiB]')
+        for variant in VARIANTS:
+            seconds, peak = measure(variant, name, html, extra, args.repeat)
+            totals[variant][0] += seconds
+            totals[variant][1] = max(totals[variant][1], peak)
+            print(f'  {variant:<14} {seconds * 1000:8.1f} ms {peak / 1024 / 1024:8.2f} MiB peak')
+
+    soup_parsers.STRAIN_LISTINGS = strain_listings
+    if not pages:
+        print('No pages to benchmark')
+        return
+    print(f'{pages} pages')
+    for variant, (seconds, peak) in totals.items():
+        print(f'  {variant:<14} {seconds / pages * 1000:8.1f} ms per page {peak / 1024 / 1024:8.2f} MiB worst peak')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,12 @@
-import aiohttp
-from bs4 import BeautifulSoup
 from typing import List
+
+from base import fetch_if_changed
+from parsers import run_parser
 from schemas.shemas import BrandCreate
 
 
-async def fetch_brands() -> List[BrandCreate]:
+async def fetch_brands(session=None, refresh=False) -> List[BrandCreate]:
     url = "https://www.wheel-size.com/size/"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            html = await response.text()
-            soup = BeautifulSoup(html, 'html.parser')
-
-            brands = [
-                BrandCreate(name=make.select_one('.brand-name').get_text(),
-                            url="https://www.wheel-size.com" + make['href'])
-                for make in soup.select('.brand-link-item')
-            ]
-            return brands
+    page = await fetch_if_changed(url, session=session, revalidate=refresh)
+    brands = [BrandCreate(**record) for record in await run_parser('brands', page.html)]
+    return brands
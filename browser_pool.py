@@ -0,0 +1,275 @@
+import asyncio
+import os
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+
+import psutil
+
+from base import create_browser, close_browser, configure_browser_executor, BrowserRestartException, \
+    BROWSER_CACHE_DIR
+from playwright_engine import PlaywrightEngine
+
+POOL_SIZE = 3  # Chrome drivers working at the same time
+PROXIES = []  # Optional proxies, drivers are pinned to them round-robin
+PROXY_WAIT = 30  # Seconds to wait for a pooled proxy before starting a driver without one
+BROWSER_ENGINE = 'selenium'  # 'selenium' runs a Chrome per slot, 'playwright' a context per slot in one Chromium
+WARM_SPARES = 1  # Drivers started ahead of time for every proxy
+LENDABLE_DRIVERS = 3  # Extra drivers lent to workers for side pages, such as a trim's regions
+
+# Drivers are retired when any of these limits is reached
+MAX_PAGES_PER_DRIVER = 200
+MAX_DRIVER_AGE = 30 * 60  # Seconds
+MAX_DRIVER_RSS = 1536 * 1024 * 1024  # Bytes, summed over the Chrome process tree
+RECYCLE_AHEAD = 0.8  # Share of a limit after which a replacement starts warming up
+
+# Why a driver is closed -> what happens to its proxy's saved session. Healthy drivers save
+# theirs, blocked ones drop it so the next driver does not start with flagged cookies
+CLOSE_SESSIONS = {'pages': 'save', 'age': 'save', 'memory': 'save', 'shutdown': 'save',
+                  'restart': 'drop', 'benched': 'drop'}
+
+
+def driver_rss(driver):
+    """Resident memory of chromedriver and every Chrome process it started."""
+    try:
+        root = psutil.Process(driver.service.process.pid)
+        processes = [root] + root.children(recursive=True)
+    except (AttributeError, psutil.Error):
+        return 0
+    rss = 0
+    for process in processes:
+        try:
+            rss += process.memory_info().rss
+        except psutil.Error:
+            continue
+    return rss
+
+
+class BrowserPool:
+    """A fixed number of Chrome drivers, one per worker slot.
+
+    For every proxy the pool keeps spare drivers starting in the background,
+    so replacing a driver after BrowserRestartException does not wait for a
+    cold Chrome start. Drivers lease disk cache directories under
+    BROWSER_CACHE_DIR that outlive them, so static assets stay cached across
+    replacements and runs.
+
+    Drivers are recycled after MAX_PAGES_PER_DRIVER pages, MAX_DRIVER_AGE
+    seconds or MAX_DRIVER_RSS bytes, whichever comes first.
+
+    With a proxy_pool, every new driver takes the best scored proxy that is
+    not cooling down instead of a fixed one, so a banned proxy is left
+    behind when its driver is replaced.
+
+    On top of the slots the pool lends up to LENDABLE_DRIVERS extra drivers
+    through lease(), so a worker can render several pages of one task at
+    once. Returned drivers stay idle until the next lease.
+
+    With the playwright engine the slots hold PlaywrightContext objects
+    sharing one Chromium process instead of Chrome drivers.
+    """
+
+    def __init__(self, size=POOL_SIZE, proxies=None, spares=WARM_SPARES, max_pages=MAX_PAGES_PER_DRIVER,
+                 max_age=MAX_DRIVER_AGE, max_rss=MAX_DRIVER_RSS, proxy_pool=None, engine=BROWSER_ENGINE,
+                 lendable=LENDABLE_DRIVERS):
+        proxies = proxies if proxies is not None else PROXIES
+        self.size = size
+        self.proxy_pool = proxy_pool
+        self.engine_name = engine
+        self.engine = None  # PlaywrightEngine when engine is 'playwright'
+        self.proxies = [proxies[i % len(proxies)] if proxies else None for i in range(size)]
+        self.spares = spares
+        self.drivers = [None] * size
+        self.max_pages = max_pages
+        self.max_age = max_age
+        self.max_rss = max_rss
+        self.recycled = Counter()  # Reason -> drivers retired for it
+        self.lifetimes = []  # (seconds alive, pages served) of every retired driver
+        self._retiring = set()  # Slots whose replacement is already warming up
+        self._spares = {}  # proxy -> tasks starting spare drivers
+        self._lendable = asyncio.Semaphore(lendable)
+        self._lent = []  # Drivers back from a lease, idle until the next one
+        self._closed = False
+        # Chrome's disk cache is single-process, so every live driver gets its own directory
+        self._cache_dirs = asyncio.Queue()
+        for index in range(2 * size + spares * len(set(self.proxies)) + lendable):
+            self._cache_dirs.put_nowait(os.path.join(BROWSER_CACHE_DIR, f'driver-{index}'))
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        if self.engine_name == 'playwright':
+            self.engine = await PlaywrightEngine().start()
+        else:
+            configure_browser_executor(self.size)
+        self.drivers = list(await asyncio.gather(*(self._create(proxy) for proxy in self.proxies)))
+        for proxy in set(self.proxies):
+            self._warm(proxy)
+        return self
+
+    async def _create(self, proxy):
+        if self.proxy_pool is not None:
+            # Slots are not pinned then, every driver takes its own proxy from the pool
+            proxy = await self.proxy_pool.acquire(timeout=PROXY_WAIT)
+        cache_dir = await self._cache_dirs.get()
+        try:
+            if self.engine is not None:
+                driver = await self.engine.new_context(proxy)
+                driver.cache_dir = cache_dir  # Unused, contexts share the browser's cache
+            else:
+                driver = await create_browser(proxy, cache_dir)
+        except BaseException:
+            self._cache_dirs.put_nowait(cache_dir)
+            raise
+        driver.pages_served = 0
+        driver.started_at = time.monotonic()
+        return driver
+
+    async def _close(self, driver, reason='shutdown'):
+        if driver is None:
+            return
+        session = CLOSE_SESSIONS.get(reason, 'keep')
+        if self.engine is not None:
+            await driver.close(session)
+        else:
+            await close_browser(driver, session)
+        self._cache_dirs.put_nowait(driver.cache_dir)
+
+    def _warm(self, proxy):
+        tasks = self._spares.setdefault(proxy, [])
+        retiring = sum(1 for slot in self._retiring if self.proxies[slot] == proxy)
+        while len(tasks) < self.spares + retiring:
+            tasks.append(asyncio.create_task(self._create(proxy)))
+
+    async def _take_spare(self, proxy):
+        tasks = self._spares.get(proxy)
+        while tasks:
+            try:
+                driver = await tasks.pop(0)
+            except Exception as e:
+                print(f"Spare browser failed to start: {e}")
+                continue
+            # Spares take their proxy when they start warming, it may have been banned since
+            if self.proxy_pool is not None and self.proxy_pool.is_benched(getattr(driver, 'proxy', None)):
+                print(f"Dropping spare browser on benched proxy {driver.proxy}")
+                await self._close(driver, 'benched')
+                continue
+            return driver
+        return await self._create(proxy)
+
+    @asynccontextmanager
+    async def lease(self, slot):
+        """Lends an extra driver on the slot's proxy for as long as the block runs.
+
+        Yields None when all lendable drivers are out, the caller then uses
+        its own. A driver the block raised BrowserRestartException with, or
+        any other error, is closed instead of being lent again.
+        """
+        if self._closed or self._lendable.locked():
+            yield None
+            return
+        async with self._lendable:
+            driver = await self._take_lent(slot)
+            try:
+                yield driver
+            except BrowserRestartException:
+                await self._close(driver, 'restart')
+                raise
+            except BaseException:
+                await self._close(driver, 'error')
+                raise
+            if self._closed:
+                await self._close(driver)
+            elif self._over_limit(driver):
+                await self._close(driver, 'pages')
+            else:
+                self._lent.append(driver)
+
+    async def _take_lent(self, slot):
+        while self._lent:
+            driver = self._lent.pop()
+            if self.proxy_pool is not None and self.proxy_pool.is_benched(getattr(driver, 'proxy', None)):
+                await self._close(driver, 'benched')
+                continue
+            return driver
+        proxy = self.proxies[slot]
+        driver = await self._take_spare(proxy)
+        self._warm(proxy)
+        return driver
+
+    def _over_limit(self, driver):
+        return ((self.max_pages and driver.pages_served >= self.max_pages)
+                or (self.max_age and time.monotonic() - driver.started_at >= self.max_age))
+
+    async def replace(self, slot, reason='restart'):
+        """Swaps the driver in a slot for a warm spare and closes the old one.
+
+        reason is also what CLOSE_SESSIONS looks up: the default 'restart'
+        follows a block, so the old driver's session is dropped, not saved.
+        """
+        old_driver = self.drivers[slot]
+        proxy = self.proxies[slot]
+        self._retiring.discard(slot)
+        if old_driver is not None:
+            self.recycled[reason] += 1
+            self.lifetimes.append((time.monotonic() - old_driver.started_at, old_driver.pages_served))
+        await self._close(old_driver, reason)
+        self.drivers[slot] = await self._take_spare(proxy)
+        self._warm(proxy)
+        return self.drivers[slot]
+
+    async def recycle_if_needed(self, slot):
+        """Retires the slot's driver when it is over a limit, warming its successor near one."""
+        driver = self.drivers[slot]
+        age = time.monotonic() - driver.started_at
+        rss = await asyncio.to_thread(driver_rss, driver) if self.max_rss else 0
+
+        reason = None
+        if self.max_pages and driver.pages_served >= self.max_pages:
+            reason = 'pages'
+        elif self.max_age and age >= self.max_age:
+            reason = 'age'
+        elif self.max_rss and rss >= self.max_rss:
+            reason = 'memory'
+        if reason:
+            print(f"Recycling browser {slot} ({reason}): {driver.pages_served} pages, "
+                  f"{age:.0f}s, {rss // (1024 * 1024)} MB")
+            return await self.replace(slot, reason)
+
+        near_limit = ((self.max_pages and driver.pages_served >= self.max_pages * RECYCLE_AHEAD)
+                      or (self.max_age and age >= self.max_age * RECYCLE_AHEAD)
+                      or (self.max_rss and rss >= self.max_rss * RECYCLE_AHEAD))
+        if near_limit and slot not in self._retiring:
+            self._retiring.add(slot)
+            self._warm(self.proxies[slot])
+        return driver
+
+    def print_stats(self):
+        if not self.lifetimes:
+            return
+        seconds = sum(lifetime for lifetime, _ in self.lifetimes) / len(self.lifetimes)
+        pages = sum(served for _, served in self.lifetimes) / len(self.lifetimes)
+        reasons = ', '.join(f'{reason}: {count}' for reason, count in self.recycled.items())
+        print(f"Browsers recycled: {len(self.lifetimes)} ({reasons}), "
+              f"average lifetime {seconds:.0f}s and {pages:.0f} pages")
+
+    async def close(self):
+        self._closed = True
+        lent, self._lent = self._lent, []
+        await asyncio.gather(*(self._close(driver) for driver in lent))
+        spares = [task for tasks in self._spares.values() for task in tasks]
+        self._spares = {}
+        for task in spares:
+            task.cancel()
+        for result in await asyncio.gather(*spares, return_exceptions=True):
+            if not isinstance(result, BaseException):
+                await self._close(result)
+        await asyncio.gather(*(self._close(driver) for driver in self.drivers))
+        self.drivers = [None] * self.size
+        if self.engine is not None:
+            await self.engine.close()
+            self.engine = None
@@ -0,0 +1,61 @@
+import re
+
+BLOCKED = 'blocked'
+CAPTCHA = 'captcha'
+TYPE_1 = 'type_1'
+TYPE_2 = 'type_2'
+TYPE_3 = 'type_3'
+UNKNOWN = 'unknown'
+
+BLOCK_SCAN_BYTES = 16 * 1024  # Block and challenge pages give themselves away this early
+
+# (page kind, marker) in the order they are checked
+MARKERS = [
+    (BLOCKED, r'403 Forbidden|(?i:access denied)'),
+    # Only markers of an interstitial challenge page. Normal pages may carry reCAPTCHA
+    # forms or Cloudflare's challenge-platform beacon, so those do not count
+    (CAPTCHA, r'''cf_chl_opt|id=["'](?:challenge-form|cf-challenge-running)["']|'''
+              r'''<title>(?:Just a moment\.\.\.|Attention Required! \| Cloudflare)</title>'''),
+    # The class strings the BeautifulSoup lookups in modifications used to match
+    (TYPE_1, r'''class=["']mb-1 text-uppercase fs-xs font-weight-bold["']'''),
+    (TYPE_3, r'''class=["']alert alert-info fs-lg["']'''),
+    (TYPE_2, r'''class=["']item flex-auto mx-0 mb-1 pt-2 text-uppercase fs-xs["']'''),
+]
+
+# Same patterns compiled for str (Selenium page_source) and bytes (raw HTTP bodies)
+_STR_MARKERS = [(kind, re.compile(pattern)) for kind, pattern in MARKERS]
+_BYTES_MARKERS = [(kind, re.compile(pattern.encode('ascii'))) for kind, pattern in MARKERS]
+_REJECT_KINDS = (BLOCKED, CAPTCHA)
+_HEAD_KINDS = (CAPTCHA,)  # Searched in the first BLOCK_SCAN_BYTES only, where challenge pages show them
+
+
+def _search(kind, marker, html):
+    if kind in _HEAD_KINDS:
+        return marker.search(html, 0, BLOCK_SCAN_BYTES)
+    return marker.search(html)
+
+
+def _markers(html):
+    return _BYTES_MARKERS if isinstance(html, (bytes, bytearray, memoryview)) else _STR_MARKERS
+
+
+def classify(html):
+    """Tells the page kind from precompiled marker searches, without building a DOM.
+
+    Works on str and bytes alike and never copies the page.
+    """
+    for kind, marker in _markers(html):
+        if _search(kind, marker, html):
+            return kind
+    return UNKNOWN
+
+
+def is_rejected(html):
+    """True for block and captcha pages."""
+    for kind, marker in _markers(html):
+        if kind in _REJECT_KINDS and _search(kind, marker, html):
+            return True
+    return False
+
+
+PAGE_TYPES = {TYPE_1: 1, TYPE_2: 2, TYPE_3: 3}
@@ -0,0 +1 @@
+# Puts the repository root on sys.path so tests import the scraper modules directly
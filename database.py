@@ -1,5 +1,5 @@
 import databases
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, select, update, insert
+from sqlalchemy import Column, Integer, String, Boolean, Float, ForeignKey, select, update, insert, inspect, text
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
@@ -132,11 +132,30 @@ class Proxy(Base):
     port = Column(String, nullable=False)
     used = Column(Boolean, default=False)
     failed = Column(Boolean, default=False)
+    successes = Column(Integer, default=0)
+    failures = Column(Integer, default=0)
+    bans = Column(Integer, default=0)
+    latency_ewma = Column(Float, nullable=True)
+    cooldown_until = Column(Float, default=0)
+
+
+def add_missing_columns(conn):
+    """create_all never alters existing tables, so add columns introduced since the table was made."""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
 
 
 async def setup_database():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(add_missing_columns)
 
 
 async def get_db():
@@ -265,6 +284,89 @@ async def update_modification_processed(db: AsyncSession, modification_id: int):
     await db.commit()
 
 
+async def reset_brands_processed(db: AsyncSession):
+    query = update(BrandModel).values(processed=False)
+    await db.execute(query)
+    await db.commit()
+
+
+async def reset_models_processed(db: AsyncSession, brand_id: int):
+    query = update(ModelModel).where(ModelModel.brand_id == brand_id).values(processed=False)
+    await db.execute(query)
+    await db.commit()
+
+
+async def get_trim_urls(db: AsyncSession, model_id: int):
+    query = select(TrimModel.url).where(TrimModel.model_id == model_id)
+    result = await db.execute(query)
+    return set(result.scalars().all())
+
+
+async def seed_rows(db: AsyncSession, model, rows, batch):
+    """Bulk inserts rows with INSERT OR IGNORE, batch rows per statement."""
+    for start in range(0, len(rows), batch):
+        await db.execute(insert(model).prefix_with('OR IGNORE'), rows[start:start + batch])
+    await db.commit()
+
+
+async def get_ids_by_url(db: AsyncSession, model, urls):
+    query = select(model.url, model.id).where(model.url.in_(urls))
+    result = await db.execute(query)
+    return dict(result.all())
+
+
+async def seed_brands(db: AsyncSession, rows, batch=500):
+    await seed_rows(db, BrandModel, rows, batch)
+    ids = {}
+    for start in range(0, len(rows), batch):
+        ids.update(await get_ids_by_url(db, BrandModel, [row['url'] for row in rows[start:start + batch]]))
+    return ids
+
+
+async def seed_models(db: AsyncSession, rows, batch=500):
+    await seed_rows(db, ModelModel, rows, batch)
+    ids = {}
+    for start in range(0, len(rows), batch):
+        ids.update(await get_ids_by_url(db, ModelModel, [row['url'] for row in rows[start:start + batch]]))
+    return ids
+
+
+async def seed_trims(db: AsyncSession, rows, batch=500):
+    # Trim urls carry no unique constraint, so known ones are filtered out here
+    result = await db.execute(select(TrimModel.url))
+    known_urls = set(result.scalars().all())
+    await seed_rows(db, TrimModel, [row for row in rows if row['url'] not in known_urls], batch)
+
+
+async def get_model_urls(db: AsyncSession, brand_id: int):
+    query = select(ModelModel.url).where(ModelModel.brand_id == brand_id)
+    result = await db.execute(query)
+    return set(result.scalars().all())
+
+
+async def rename_by_url(db: AsyncSession, model, url, name):
+    """Replaces a slug-derived name given to a row seeded from the sitemap."""
+    query = update(model).where(model.url == str(url)).values(name=name)
+    await db.execute(query)
+    await db.commit()
+
+
+async def enrich_trim(db: AsyncSession, trim: TrimCreate, model_id: int):
+    """Fills in a trim seeded from the sitemap with the details of its model page."""
+    query = update(TrimModel).where(
+        TrimModel.model_id == model_id,
+        TrimModel.url == str(trim.url),
+        TrimModel.year_from == None
+    ).values(
+        name=trim.name,
+        year_from=trim.year_from,
+        year_to=trim.year_to,
+        regions=', '.join(trim.regions)
+    )
+    await db.execute(query)
+    await db.commit()
+
+
 async def get_unprocessed_brands(db: AsyncSession):
     query = select(BrandModel).where(BrandModel.processed == False)
     result = await db.execute(query)
@@ -309,6 +411,31 @@ async def mark_proxy_as_failed(db: AsyncSession, proxy):
     await db.commit()
 
 
+async def get_usable_proxies(db: AsyncSession):
+    query = select(Proxy).where(Proxy.failed == False)
+    result = await db.execute(query)
+    return result.scalars().all()
+
+
+async def get_proxy(db: AsyncSession, ip):
+    query = select(Proxy).where(Proxy.ip == ip)
+    result = await db.execute(query)
+    return result.scalars().first()
+
+
+async def update_proxy_stats(db: AsyncSession, proxy):
+    query = update(Proxy).where(Proxy.id == proxy.id).values(
+        successes=proxy.successes,
+        failures=proxy.failures,
+        bans=proxy.bans,
+        latency_ewma=proxy.latency_ewma,
+        cooldown_until=proxy.cooldown_until,
+        failed=proxy.failed
+    )
+    await db.execute(query)
+    await db.commit()
+
+
 async def add_proxy(db: AsyncSession, ip, port):
     query = insert(Proxy).values(ip=ip, port=port)
     try:
@@ -0,0 +1,159 @@
+import base64
+import json
+import os
+import re
+import time
+from collections import Counter
+from typing import Any, NamedTuple
+
+# Finish trim pages on XHR idle and keep their JSON responses. Only pays off with a parser
+# registered for the site's endpoints, until then it just dumps them to CAPTURE_DUMP_DIR
+CAPTURE_MODE = False
+XHR_IDLE_MS = 300  # No XHR may be in flight for this long before the page counts as loaded
+XHR_POLL_INTERVAL = 0.05
+CAPTURE_DUMP_DIR = None  # Directory to save captured JSON to, handy when writing a parser
+
+# (compiled url pattern, parser) pairs, see register_capture_parser
+CAPTURE_PARSERS = []
+
+
+class CapturedResponse(NamedTuple):
+    url: str
+    status: int
+    mime_type: str
+    body: Any
+
+
+def register_capture_parser(url_pattern):
+    """Registers parser(responses, trim_id) -> List[ModificationCreate] for captured
+    JSON responses whose url matches url_pattern."""
+    def decorator(parser):
+        CAPTURE_PARSERS.append((re.compile(url_pattern), parser))
+        return parser
+    return decorator
+
+
+def read_performance_log(driver):
+    """Drains the driver's performance log and returns the DevTools messages in it."""
+    messages = []
+    for entry in driver.get_log('performance'):
+        try:
+            messages.append(json.loads(entry['message'])['message'])
+        except (KeyError, ValueError):
+            continue
+    return messages
+
+
+def drain_network_events(driver):
+    """Moves new DevTools messages into driver.network_events and returns all of the current page's."""
+    events = getattr(driver, 'network_events', None)
+    if events is None:
+        events = driver.network_events = []
+    events.extend(read_performance_log(driver))
+    return events
+
+
+def page_traffic(messages):
+    """Sums bytes transferred, bytes served from the disk cache and blocked requests."""
+    traffic = Counter()
+    cached_requests = set()
+    for message in messages:
+        method = message.get('method')
+        params = message.get('params', {})
+        if method == 'Network.loadingFinished':
+            traffic['transferred'] += int(params.get('encodedDataLength', 0))
+        elif method == 'Network.responseReceived' and params.get('response', {}).get('fromDiskCache'):
+            cached_requests.add(params.get('requestId'))
+        elif method == 'Network.dataReceived' and params.get('requestId') in cached_requests:
+            traffic['from_cache'] += int(params.get('dataLength', 0))
+        elif method == 'Network.loadingFailed' and params.get('blockedReason'):
+            traffic['blocked'] += 1
+    return traffic
+
+
+def xhr_requests(messages):
+    """Returns the ids of XHR/fetch requests still in flight and the responses of finished ones."""
+    pending = set()
+    responses = {}
+    for message in messages:
+        method = message.get('method')
+        params = message.get('params', {})
+        request_id = params.get('requestId')
+        if method == 'Network.requestWillBeSent' and params.get('type') in ('XHR', 'Fetch'):
+            pending.add(request_id)
+        elif method == 'Network.responseReceived' and params.get('type') in ('XHR', 'Fetch'):
+            responses[request_id] = params.get('response', {})
+        elif method in ('Network.loadingFinished', 'Network.loadingFailed'):
+            pending.discard(request_id)
+            if method == 'Network.loadingFailed':
+                responses.pop(request_id, None)
+    finished = {request_id: response for request_id, response in responses.items() if request_id not in pending}
+    return pending, finished
+
+
+def wait_for_xhr_idle(driver, timeout=30):
+    """Blocks until the document is parsed and no XHR has been in flight for XHR_IDLE_MS."""
+    deadline = time.monotonic() + timeout
+    idle_since = None
+    while time.monotonic() < deadline:
+        pending, _ = xhr_requests(drain_network_events(driver))
+        loading = driver.execute_script("return document.readyState") == 'loading'
+        if pending or loading:
+            idle_since = None
+        elif idle_since is None:
+            idle_since = time.monotonic()
+        elif (time.monotonic() - idle_since) * 1000 >= XHR_IDLE_MS:
+            return
+        time.sleep(XHR_POLL_INTERVAL)
+
+
+def collect_json_responses(driver):
+    """Reads the bodies of the page's finished JSON XHR responses through CDP."""
+    _, finished = xhr_requests(drain_network_events(driver))
+    captured = []
+    for request_id, response in finished.items():
+        mime_type = response.get('mimeType', '')
+        if 'json' not in mime_type:
+            continue
+        try:
+            result = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+            body = result['body']
+            if result.get('base64Encoded'):
+                body = base64.b64decode(body).decode('utf-8')
+            captured.append(CapturedResponse(response.get('url', ''), response.get('status', 0),
+                                             mime_type, json.loads(body)))
+        except Exception as e:
+            print(f"Failed to read XHR response {response.get('url')}: {e}")
+    if CAPTURE_DUMP_DIR and captured:
+        dump_responses(captured)
+    return captured
+
+
+def dump_responses(responses):
+    os.makedirs(CAPTURE_DUMP_DIR, exist_ok=True)
+    for response in responses:
+        name = re.sub(r'[^\w.-]+', '_', response.url)[-150:]
+        with open(os.path.join(CAPTURE_DUMP_DIR, name + '.json'), 'w', encoding='utf-8') as dump:
+            json.dump(response.body, dump, ensure_ascii=False, indent=2)
+
+
+def capture_wanted():
+    """True when captured responses are used at all: parsed, or dumped for writing a parser."""
+    return bool(CAPTURE_PARSERS or CAPTURE_DUMP_DIR)
+
+
+def matches_capture_parser(responses):
+    """True when a registered parser applies to any of the responses."""
+    return any(pattern.search(response.url) for pattern, _ in CAPTURE_PARSERS for response in responses)
+
+
+def parse_captured(responses, trim_id):
+    """Hands captured responses to the first registered parser whose pattern they match.
+
+    Returns None when no parser applies, the caller then parses the DOM.
+    """
+    for pattern, parser in CAPTURE_PARSERS:
+        matched = [response for response in responses or [] if pattern.search(response.url)]
+        if matched:
+            return parser(matched, trim_id)
+    return None
@@ -0,0 +1,360 @@
+import re
+from collections import defaultdict
+
+from lxml import etree
+
+from soup_parsers import SITE_URL, HELP_TEXT, EMPTY_SIZE, SIZE_BADGES, clean_text, split_front_rear
+
+POWER_CLASS = 'position-absolute pos-top pos-right mr-1 fs-sm font-weight-light'
+
+_html_parser = etree.HTMLParser(encoding='utf-8')
+_whitespace = re.compile(r'\s+')
+
+
+# XPath equivalents of the BeautifulSoup lookups: class_='x' matches one class
+# token, a class_ with spaces matches the whole attribute value
+def has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def class_is(value):
+    return f"normalize-space(@class) = '{value}'"
+
+
+def make_tree(html):
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+    return etree.fromstring(html, _html_parser)
+
+
+def first(element, path, **variables):
+    found = element.xpath(path, **variables)
+    return found[0] if found else None
+
+
+def get_text(element, strip=False):
+    """BeautifulSoup's get_text(): descendant text without comments, stripped piecewise with strip."""
+    strings = element.xpath('.//text()')
+    if strip:
+        return ''.join(text.strip() for text in strings if text.strip())
+    return ''.join(strings)
+
+
+def child_strings(element):
+    """The text nodes and tags directly under element, in the order BeautifulSoup's .children gives them."""
+    if element.text:
+        yield element.text
+    for child in element:
+        if not isinstance(child.tag, str):
+            if child.text:
+                yield child.text  # Comments are strings to BeautifulSoup
+        else:
+            yield child
+        if child.tail:
+            yield child.tail
+
+
+def next_sibling_string(element):
+    """BeautifulSoup's find_next_sibling(text=True)."""
+    if element.tail:
+        return element.tail
+    for sibling in element.itersiblings():
+        if not isinstance(sibling.tag, str):
+            return sibling.text or ''  # Comments are strings to BeautifulSoup
+        if sibling.tail:
+            return sibling.tail
+    return None
+
+
+def parse_brands(html):
+    tree = make_tree(html)
+    return [
+        {'name': get_text(first(make, f".//*[{has_class('brand-name')}]")), 'url': SITE_URL + make.get('href')}
+        for make in tree.xpath(f"//*[{has_class('brand-link-item')}]")
+    ]
+
+
+def parse_models(html):
+    tree = make_tree(html)
+    return [
+        {'name': get_text(first(model, f".//*[{has_class('model-name')}]")).strip(),
+         'url': SITE_URL + model.get('href')}
+        for model in tree.xpath(f"//*[{has_class('market-item')}]//a")
+    ]
+
+
+def parse_trims(html):
+    tree = make_tree(html)
+    trims = []
+    for section in tree.xpath(f"//div[{has_class('market-generation')}]"):
+        link = first(section, '(.//a[@title])[1]')
+        if link is None:
+            continue
+        name_part = link.get('title').split(':')[-1].strip()
+
+        name = name_part
+        year_from = None
+        year_to = None
+
+        if '[' in name_part and ']' in name_part:
+            try:
+                name, years = name_part.split('[')
+                years = years.strip(']').split('..')
+                year_from = int(years[0].strip())
+                year_to = int(years[1].strip()) if len(years) > 1 else None
+            except ValueError as ve:
+                print(f"Error parsing years from {name_part}: {ve}")
+        elif '..' in name_part:
+            try:
+                name, years = name_part.split('..')
+                year_from = int(name.split()[-1])
+                name = ' '.join(name.split()[:-1]).strip()
+                year_to = int(years.strip())
+            except ValueError as ve:
+                print(f"Error parsing years from {name_part}: {ve}")
+        else:
+            print(f"Invalid format for name and years: {name_part}")
+            continue
+
+        regions = [get_text(region).strip() for region in section.xpath(
+            f".//span[{class_is('badge border border-secondary text-secondary mb-1')}]")]
+
+        trims.append({'name': name.strip(), 'year_from': year_from, 'year_to': str(year_to),
+                      'url': SITE_URL + link.get('href'), 'regions': regions})
+    return trims
+
+
+def parse_trim_page(html, page_type, trim_id, require_complete=False):
+    tree = make_tree(html)
+    if require_complete and not is_page_complete(tree, page_type):
+        return None
+    if page_type == 2:
+        return {'modifications': [], 'region_urls': parse_region_urls(tree)}
+    return {'modifications': parse_modifications(tree, trim_id), 'region_urls': []}
+
+
+def is_page_complete(tree, page_type) -> bool:
+    if page_type == 2:
+        return bool(tree.xpath(f"//div[{has_class('market-filter')}]"))
+    if page_type in (1, 3):
+        if not tree.xpath(f"//div[{has_class('data-parameters')}]") or not tree.xpath('//tbody'):
+            return False
+        if tree.xpath(f"//i[{has_class('fa-spinner')}]"):
+            return False
+        return all(get_text(span, strip=True)
+                   for span in tree.xpath(f"//li[{has_class('element-parameter')}]//span[@id]"))
+    return False
+
+
+def parse_modifications(tree, trim_id: int) -> list:
+    modifications = []
+    panels = index_ids(tree)
+    for engine_section in tree.xpath(f"//div[{has_class('panel-content')}]"):
+        for fuel_type in engine_section.xpath(f".//div[{has_class('mt-2')}]"):
+            for link in fuel_type.xpath(f".//a[{has_class('js-scroll-trigger')}]"):
+                power = get_text(first(link, f".//span[{class_is(POWER_CLASS)}]")).strip()
+                href = link.get('href')
+                panel_id = href.split('#')[-1]
+
+                panel_div = panels.get(panel_id)
+                if not panel_div:
+                    print(f"Panel with id {panel_id} not found for URL: {href}")
+                    continue
+
+                modification_tree = None
+                for panel in panel_div:
+                    modification_tree = first(panel, f"descendant-or-self::div[{has_class('panel-content')}]")
+                    if modification_tree is not None:
+                        break
+                if modification_tree is None:
+                    print(f"Modification data not found for panel id: {panel_id}")
+                    continue
+
+                modification_info = parse_modification_info(modification_tree)
+
+                modifications.append({
+                    'trim_id': trim_id,
+                    'name': get_text(first(link, f".//span[{has_class('position-relative')}]")).strip(),
+                    'year_from': int(modification_info['year_from']),
+                    'year_to': str(modification_info['year_to']),
+                    'regions': modification_info['regions'],
+                    'url': SITE_URL + href,
+                    'engine': modification_info['engine'],
+                    'power': power,
+                    'center_bore_hub_bore': modification_info['center_bore_hub_bore'],
+                    'bolt_pattern_pcd': modification_info['bolt_pattern_pcd'],
+                    'wheel_fasteners': modification_info['wheel_fasteners'],
+                    'thread_size': modification_info['thread_size'],
+                    'wheel_tightening': modification_info['wheel_tightening'],
+                    'fuel': get_text(first(fuel_type, './/h5')).strip().replace(':', ''),
+                    'trim_levels': modification_info['trim_levels'],
+                    'sizes': modification_info['sizes']
+                })
+    return modifications
+
+
+def index_ids(tree) -> dict:
+    ids = defaultdict(list)
+    for element in tree.xpath('//*[@id]'):
+        ids[element.get('id')].append(element)
+    return ids
+
+
+def parse_region_urls(tree) -> list:
+    market_filter = first(tree, f"//div[{has_class('market-filter')}]")
+    return [SITE_URL + link.get('href') for link in market_filter.xpath('.//a')]
+
+
+def parse_modification_info(element) -> dict:
+    info = {
+        'year_from': None,
+        'year_to': None,
+        'regions': [],
+        'center_bore_hub_bore': None,
+        'bolt_pattern_pcd': None,
+        'wheel_fasteners': None,
+        'thread_size': None,
+        'wheel_tightening': None,
+        'engine': None,
+        'trim_levels': None,
+        'sizes': []
+    }
+    parameters = first(element, f".//div[{has_class('data-parameters')}]")
+
+    for param in parameters.xpath(f".//li[{has_class('element-parameter')}]"):
+        param_name = get_text(first(param, f".//span[{has_class('parameter-name')}]")).strip()
+        text = get_text(param, strip=True)
+
+        if 'Engine' in param_name:
+            parts = text.split(':')
+            info['engine'] = _whitespace.sub(' ', parts[1]).strip() if len(parts) > 1 else None
+
+        elif 'Production' in param_name:
+            years = text.split(':')[-1].replace('[', '').replace(']', '').split('..')
+            info['year_from'] = int(years[0].strip())
+            info['year_to'] = years[1].strip() if len(years) > 1 else 'Present'
+
+        elif 'Sales regions' in param_name:
+            regions = param.xpath(f".//span[{class_is('cursor-pointer as_link')}]")
+            info['regions'] = [get_text(region, strip=True) for region in regions]
+
+        elif 'Center Bore / Hub Bore' in param_name:
+            info['center_bore_hub_bore'] = id_span_text(param)
+
+        elif 'Bolt Pattern (PCD)' in param_name:
+            info['bolt_pattern_pcd'] = text.split(':')[-1].strip() or "unknown"
+
+        elif 'Wheel Fasteners' in param_name:
+            fasteners = first(param, '(.//div)[1]')
+            info['wheel_fasteners'] = get_text(fasteners, strip=True).split(':')[
+                -1].strip() if fasteners is not None else "unknown"
+
+        elif 'Thread Size' in param_name:
+            info['thread_size'] = id_span_text(param)
+
+        elif 'Wheel Tightening Torque' in param_name:
+            info['wheel_tightening'] = id_span_text(param)
+
+        elif 'Trim levels' in param_name:
+            info['trim_levels'] = text.split(':')[-1].strip() or "unknown"
+
+    tbody = first(element, '(.//tbody)[1]')
+    info['sizes'] = [parse_sizes(row) for row in tbody.xpath('.//tr')]
+    return info
+
+
+def id_span_text(param):
+    span = first(param, '(.//span[@id])[1]')
+    return get_text(span, strip=True) if span is not None else "unknown"
+
+
+def rim_values(cell):
+    loaded = first(cell, f"(.//span[{has_class('js-loaded')}])[1]")
+    if loaded is not None:
+        front_rim = get_text(loaded, strip=True)
+    else:
+        front_rim = None
+        masha_index = first(cell, f"(.//span[{has_class('masha_index')}])[1]")
+        if masha_index is not None:
+            front_rim = next_sibling_string(masha_index)
+            if front_rim:
+                front_rim = front_rim.strip()
+    if front_rim == HELP_TEXT:
+        front_rim = None
+
+    rear_rim = None
+    rear_rim_data = first(cell, f"(.//span[{has_class('rear-rim-data-full')}])[1]")
+    if rear_rim_data is not None:
+        rear_rim = get_text(rear_rim_data, strip=True)
+        if rear_rim == HELP_TEXT:
+            rear_rim = None
+    return split_front_rear(front_rim, rear_rim)
+
+
+def offset_values(cell):
+    texts = [text for text in (get_text(span, strip=True) for span in cell.xpath('.//span')) if text]
+    return split_front_rear(texts[0] if len(texts) > 0 else None, texts[1] if len(texts) > 1 else None)
+
+
+def metric_values(cell):
+    metric_span = first(cell, f"(.//span[{has_class('metric')}])[1]")
+    if metric_span is None:
+        return None
+    content = []
+    for node in child_strings(metric_span):
+        if isinstance(node, str):
+            content.append(node.strip())
+        elif node.tag == 'br':
+            content.append('<br>')
+    values = ''.join(content).split('<br>')
+    front = clean_text(values[0])
+    return front, clean_text(values[1]) if len(values) > 1 else front
+
+
+SIZE_COLUMNS = {
+    'data-rim': ('rim', rim_values),
+    'data-offset-range': ('offset', offset_values),
+    'data-backspacing': ('backspacing', metric_values),
+    'data-weight': ('weight', metric_values),
+    'data-pressure': ('pressure', metric_values),
+}
+
+
+def parse_sizes(row) -> dict:
+    size_info = dict(EMPTY_SIZE)
+    tires = []
+    load_indexes = []
+    cells = {}
+
+    for element in row.iterdescendants():
+        if element.tag == 'span':
+            badge = SIZE_BADGES.get(element.get('data-original-title'))
+            if badge:
+                size_info[badge] = True
+            if element.get('data-tire') is not None:
+                tires.append(element)
+            if 'tire_load_index' in (element.get('class') or '').split():
+                load_indexes.append(element)
+        elif element.tag == 'td':
+            for class_name in (element.get('class') or '').split():
+                if class_name in SIZE_COLUMNS:
+                    cells.setdefault(class_name, element)
+
+    if len(tires) in (1, 2):
+        size_info['tire_front'] = get_text(first(tires[0], './/span'), strip=True)
+        size_info['tire_rear'] = get_text(first(tires[-1], './/span'), strip=True)
+    if len(load_indexes) in (1, 2):
+        front_index = get_text(load_indexes[0]).strip()
+        rear_index = get_text(load_indexes[-1]).strip()
+        size_info['load_index_front'] = front_index[:-1]
+        size_info['speed_index_front'] = front_index[-1]
+        size_info['load_index_rear'] = rear_index[:-1]
+        size_info['speed_index_rear'] = rear_index[-1]
+
+    for class_name, cell in cells.items():
+        prefix, values = SIZE_COLUMNS[class_name]
+        pair = values(cell)
+        if pair is not None:
+            size_info[f'{prefix}_front'], size_info[f'{prefix}_rear'] = pair
+
+    return size_info
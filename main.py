@@ -1,77 +1,184 @@
+import argparse
 import asyncio
 from sqlalchemy.exc import IntegrityError
-from base import create_browser, BrowserRestartException
+from base import BrowserRestartException, get_session, close_session, print_traffic_stats
+from retry import retry_policy
 from brands import fetch_brands
+from browser_pool import BrowserPool, POOL_SIZE
 from database import setup_database, create_brand, get_unprocessed_brands, get_unprocessed_models, \
-    get_unprocessed_trims, SessionLocal
+    get_unprocessed_trims, reset_brands_processed, rename_by_url, BrandModel, SessionLocal
 from models import fetch_and_insert_models
-from modifications import fetch_and_insert_modifications
+from page_cache import close_page_cache
+from parsers import shutdown_parse_executor
+from proxy import proxy_pool, ProxyHarvester
+from sitemap import seed_from_sitemap
+from modifications import fetch_and_insert_modifications, print_fetch_stats
 from trims import fetch_and_insert_trims
 import traceback
 
+BRAND_WORKERS = 4  # Concurrent workers for the brand -> models phase
+MODEL_WORKERS = 8  # Concurrent workers for the model -> trims phase
+MAX_CONCURRENCY = 8  # Global cap on in-flight listing fetches across all workers
+USE_PROXY_POOL = False  # Give browsers scored proxies from the proxies table
+MAX_TRIM_RESTARTS = 5  # Browser restarts spent on one trim before it is skipped
 
-async def process_brands(unprocessed_brands, db):
-    for brand in unprocessed_brands:
-        await asyncio.sleep(5)  # Sleep to avoid being blocked by the server for 2 seconds
-        await fetch_and_insert_models(brand.id, brand.url, db=db)
 
+async def run_workers(items, handler, workers, semaphore):
+    """Drains items from a shared queue with a bounded number of workers.
 
-async def process_models(unprocessed_models, db):
-    for model in unprocessed_models:
-        await asyncio.sleep(5)  # Sleep to avoid being blocked by the server for 2 seconds
-        await fetch_and_insert_trims(model.id, model.url, db=db)
+    Every worker opens its own AsyncSession, the semaphore caps how many
+    handlers run at once across all phases.
+    """
+    queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
 
+    async def worker():
+        async with SessionLocal() as db:
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    async with semaphore:
+                        await handler(item, db)
+                except Exception as e:
+                    print("Traceback (most recent call last):")
+                    traceback.print_exc()
+                    print(f"Unexpected error processing {item.url}: {e}")
+                finally:
+                    queue.task_done()
 
-async def process_trim(trim, db, browser):
-    await fetch_and_insert_modifications(trim.id, trim.url, db=db, browser=browser)
+    await asyncio.gather(*(worker() for _ in range(min(workers, len(items)))))
 
 
-async def process_trims(unprocessed_trims, db):
-    browser = await create_browser()  # Create browser once for processing all trims
-    for trim in unprocessed_trims:
-        processed = False
-        while not processed:
-            try:
-                await asyncio.sleep(2)  # Sleep to avoid being blocked by the server for 2 seconds
-                await process_trim(trim, db, browser)
-                processed = True
-            except BrowserRestartException:
-                browser.close()
-                browser = await create_browser()
-                await asyncio.sleep(1)
-            except Exception as e:
-                # Print the traceback and continue processing other trims
-                print("Traceback (most recent call last):")
-                traceback.print_exc()
-
-                print(f"Unexpected error processing trim {trim.id}: {e}")
-                processed = True  # Skip this trim after logging the error
-    browser.close()  # Ensure the browser is closed after processing
-
-
-async def main():
-    await setup_database()
+async def process_brands(unprocessed_brands, semaphore, session=None, workers=BRAND_WORKERS, refresh=False,
+                         force_subtree=False):
+    async def handle(brand, db):
+        await fetch_and_insert_models(brand.id, brand.url, db=db, session=session, refresh=refresh,
+                                      force_subtree=force_subtree)
+
+    await run_workers(unprocessed_brands, handle, workers, semaphore)
+
 
-    async with SessionLocal() as db:
-        brands = await fetch_brands()
-        for brand in brands:
-            try:
-                await create_brand(db, brand)
-            except IntegrityError as e:
-                print(f'Error while creating brand {brand.name}: {e}')
+async def process_models(unprocessed_models, semaphore, session=None, workers=MODEL_WORKERS, refresh=False,
+                         force_subtree=False):
+    async def handle(model, db):
+        await fetch_and_insert_trims(model.id, model.url, db=db, session=session, refresh=refresh,
+                                     force_subtree=force_subtree)
 
-        unprocessed_brands = await get_unprocessed_brands(db)
-        if unprocessed_brands:
-            await process_brands(unprocessed_brands, db)
+    await run_workers(unprocessed_models, handle, workers, semaphore)
 
-        unprocessed_models = await get_unprocessed_models(db)
-        if unprocessed_models:
-            await process_models(unprocessed_models, db)
 
-        unprocessed_trims = await get_unprocessed_trims(db)
-        if unprocessed_trims:
-            await process_trims(unprocessed_trims, db)
+async def process_trim(trim, db, browser, lease=None):
+    await fetch_and_insert_modifications(trim.id, trim.url, db=db, browser=browser, lease=lease)
+
+
+async def process_trims(unprocessed_trims, pool_size=POOL_SIZE, proxies=None):
+    """Spreads trims over a pool of Chrome drivers, one worker per driver."""
+    queue = asyncio.Queue()
+    for trim in unprocessed_trims:
+        queue.put_nowait(trim)
+
+    async def worker(pool, slot):
+        async with SessionLocal() as db:
+            while True:
+                try:
+                    trim = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                processed = False
+                restarts = 0
+                while not processed:
+                    try:
+                        await process_trim(trim, db, pool.drivers[slot], lease=lambda: pool.lease(slot))
+                        processed = True
+                        await pool.recycle_if_needed(slot)
+                    except BrowserRestartException:
+                        restarts += 1
+                        await pool.replace(slot)
+                        if restarts >= MAX_TRIM_RESTARTS:
+                            print(f"Giving up on trim {trim.id} after {restarts} browser restarts")
+                            processed = True
+                        else:
+                            await asyncio.sleep(retry_policy.delay(restarts))
+                    except Exception as e:
+                        # Print the traceback and continue processing other trims
+                        print("Traceback (most recent call last):")
+                        traceback.print_exc()
+
+                        print(f"Unexpected error processing trim {trim.id}: {e}")
+                        processed = True  # Skip this trim after logging the error
+
+    pool_size = min(pool_size, len(unprocessed_trims))
+    pooled = await proxy_pool.load() if USE_PROXY_POOL else None
+    harvester = await ProxyHarvester(pooled).start() if pooled else None
+    try:
+        async with BrowserPool(pool_size, proxies, proxy_pool=pooled) as pool:
+            await asyncio.gather(*(worker(pool, slot) for slot in range(pool.size)))
+            pool.print_stats()
+    finally:
+        if harvester:
+            await harvester.stop()
+    print_fetch_stats()
+    print_traffic_stats()
+
+
+async def main(refresh=False, force_subtree=False, sitemap=False, enrich=False):
+    """Crawls the catalog. With refresh, every brand is revisited with conditional
+    requests and only the subtrees of changed listing pages are walked again.
+    With sitemap, brands, models and trims are seeded from the sitemap first and
+    their listing pages are only crawled when enrich asks for the details."""
+    await setup_database()
+    session = get_session()  # One pooled HTTP session for the whole crawl
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+
+    try:
+        async with SessionLocal() as db:
+            if sitemap:
+                await seed_from_sitemap(db, session=session, enrich=enrich)
+
+            brands = await fetch_brands(session=session, refresh=refresh)
+            for brand in brands:
+                try:
+                    await create_brand(db, brand)
+                except IntegrityError as e:
+                    await db.rollback()
+                    if sitemap:
+                        # Brands seeded from the sitemap carry a name made from the url
+                        await rename_by_url(db, BrandModel, brand.url, brand.name)
+                    else:
+                        print(f'Error while creating brand {brand.name}: {e}')
+
+            if refresh:
+                await reset_brands_processed(db)
+
+            unprocessed_brands = await get_unprocessed_brands(db)
+            if unprocessed_brands:
+                await process_brands(unprocessed_brands, semaphore, session=session, refresh=refresh,
+                                     force_subtree=force_subtree)
+
+            unprocessed_models = await get_unprocessed_models(db)
+            if unprocessed_models:
+                await process_models(unprocessed_models, semaphore, session=session, refresh=refresh,
+                                     force_subtree=force_subtree)
+
+            unprocessed_trims = await get_unprocessed_trims(db)
+            if unprocessed_trims:
+                await process_trims(unprocessed_trims)
+    finally:
+        await close_session()
+        shutdown_parse_executor()
+        close_page_cache()
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--refresh', action='store_true', help='recrawl brands and models, skipping unchanged pages')
+    parser.add_argument('--force-subtree', action='store_true', help='walk subtrees of unchanged pages too')
+    parser.add_argument('--sitemap', action='store_true', help='seed brands, models and trims from the sitemap')
+    parser.add_argument('--enrich', action='store_true', help='crawl listing pages of sitemap-seeded rows for details')
+    args = parser.parse_args()
+    asyncio.run(main(refresh=args.refresh, force_subtree=args.force_subtree, sitemap=args.sitemap,
+                     enrich=args.enrich))
@@ -1,29 +1,38 @@
-from bs4 import BeautifulSoup
-
-from base import fetch_with_retry, get_free_proxy
-from database import create_model, update_brand_processed, SessionLocal
+from base import fetch_if_changed, remember_page, get_free_proxy
+from database import create_model, update_brand_processed, reset_models_processed, get_model_urls, rename_by_url, \
+    ModelModel, SessionLocal
+from parsers import run_parser
 from schemas.shemas import CarModelCreate
 
 
-async def fetch_and_insert_models(brand_id, brand_url, db, proxy=None):
+async def fetch_and_insert_models(brand_id, brand_url, db, proxy=None, session=None, refresh=False,
+                                  force_subtree=False):
+
+    page = await fetch_if_changed(brand_url, proxy=proxy, session=session, revalidate=refresh)
+    known_urls = await get_model_urls(db, brand_id)
+    # Only a refresh of a brand whose models are already stored may skip it
+    if refresh and known_urls and not page.changed and not force_subtree:
+        print(f'Brand page {brand_url} is unchanged, skipping its models')
+        await update_brand_processed(db, brand_id)
+        return
 
-    html = await fetch_with_retry(brand_url, proxy=proxy)
-    soup = BeautifulSoup(html, 'html.parser')
-    models = [
-        CarModelCreate(
-            name=model.select_one('.model-name').text.strip(),
-            url="https://www.wheel-size.com" + model['href']
-        )
-        for model in soup.select('.market-item a')
-    ]
+    models = [CarModelCreate(**record) for record in await run_parser('models', page.html)]
 
     try:
         for model in models:
+            if str(model.url) in known_urls:
+                # Models seeded from the sitemap carry a name made from the url
+                await rename_by_url(db, ModelModel, model.url, model.name)
+                continue
             try:
                 print(f'Creating model {model.name}')
                 await create_model(db, model, brand_id)
             except Exception as e:
                 print(f'Error while creating model {model.name}: {e}')
         await update_brand_processed(db, brand_id)
+        if refresh:
+            # Let the models revalidate their own pages
+            await reset_models_processed(db, brand_id)
+        await remember_page(brand_url, page)
     except Exception as e:
         print(f'Error while processing models: {e}')
@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import zstandard
+
+PAGE_CACHE_ENABLED = True
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.page_cache')
+CACHE_TTL = 7 * 24 * 60 * 60  # Seconds a cached page is served without refetching
+CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # Compressed size on disk before LRU eviction
+COMPRESSION_LEVEL = 10
+ACCESS_FLUSH_BATCH = 200  # Cache hits whose access time is written to the index in one commit
+
+_page_cache = None
+
+
+class _LoadAbandoned(Exception):
+    """Tells the callers waiting on a load that the caller running it was cancelled."""
+
+
+def cache_key(url, kind='http'):
+    return f'{kind}:{normalize_url(url)}'
+
+
+def normalize_url(url):
+    """Lowercases scheme and host, drops the fragment and default ports, sorts the query."""
+    parts = urlsplit(str(url))
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f'{host}:{parts.port}'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+
+class PageCache:
+    """Content-addressed, zstd-compressed page store with TTL and LRU eviction.
+
+    Bodies live under objects/ named by their sha256, an SQLite index maps
+    cache keys to digests and the ETag / Last-Modified validators the server
+    sent. Concurrent fetches of the same key share one in-flight load.
+
+    The methods block on disk, compression and SQLite. Coroutines go through
+    run(), which keeps all of that on one thread off the event loop. Access
+    times of cache hits are written in batches.
+
+    The processed table remembers the digest of the last version of a page
+    whose data was fully stored, so a recrawl can tell unchanged pages.
+    """
+
+    def __init__(self, path=CACHE_DIR, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(path, 'objects'), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(path, 'index.sqlite'), check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            'key TEXT PRIMARY KEY, digest TEXT NOT NULL, size INTEGER NOT NULL, '
+            'stored REAL NOT NULL, accessed REAL NOT NULL, etag TEXT, last_modified TEXT)'
+        )
+        columns = {row[1] for row in self.db.execute('PRAGMA table_info(pages)')}
+        for column in ('etag', 'last_modified'):
+            if column not in columns:
+                self.db.execute(f'ALTER TABLE pages ADD COLUMN {column} TEXT')
+        self.db.execute('CREATE TABLE IF NOT EXISTS processed (key TEXT PRIMARY KEY, digest TEXT NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed)')
+        self.db.commit()
+        self.compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+        self.decompressor = zstandard.ZstdDecompressor()
+        self.total_bytes = self._blob_bytes()
+        self._inflight = {}
+        self._accessed = {}  # key -> access time not yet written to the index
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix='page-cache')
+
+    async def run(self, method, *args, **kwargs):
+        """Runs one of the blocking methods on the cache's own thread."""
+        return await asyncio.get_running_loop().run_in_executor(self._io, partial(method, *args, **kwargs))
+
+    def _blob_path(self, digest):
+        return os.path.join(self.path, 'objects', digest[:2], digest + '.zst')
+
+    def _blob_bytes(self):
+        row = self.db.execute('SELECT SUM(size) FROM (SELECT MAX(size) AS size FROM pages GROUP BY digest)').fetchone()
+        return row[0] or 0
+
+    def entry(self, key):
+        """Returns (digest, stored, etag, last_modified) for key, stale or not."""
+        return self.db.execute('SELECT digest, stored, etag, last_modified FROM pages WHERE key = ?',
+                               (key,)).fetchone()
+
+    def keys(self, kind=None):
+        """Lists the cached keys, only those of one kind when given."""
+        if kind is None:
+            rows = self.db.execute('SELECT key FROM pages ORDER BY key')
+        else:
+            rows = self.db.execute('SELECT key FROM pages WHERE key LIKE ? ORDER BY key', (f'{kind}:%',))
+        return [row[0] for row in rows]
+
+    def is_fresh(self, stored):
+        return not self.ttl or time.time() - stored <= self.ttl
+
+    def get(self, key, allow_stale=False):
+        row = self.db.execute('SELECT digest, stored FROM pages WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        digest, stored = row
+        if not allow_stale and not self.is_fresh(stored):
+            return None
+        try:
+            with open(self._blob_path(digest), 'rb') as blob:
+                body = self.decompressor.decompress(blob.read())
+        except (OSError, zstandard.ZstdError):
+            self._drop(key, digest)
+            return None
+        self._accessed[key] = time.time()
+        if len(self._accessed) >= ACCESS_FLUSH_BATCH:
+            self.flush()
+        return body.decode('utf-8')
+
+    def flush(self):
+        """Writes the batched access times of cache hits to the index."""
+        if not self._accessed:
+            return
+        self.db.executemany('UPDATE pages SET accessed = ? WHERE key = ?',
+                            [(accessed, key) for key, accessed in self._accessed.items()])
+        self.db.commit()
+        self._accessed = {}
+
+    def put(self, key, html, etag=None, last_modified=None):
+        """Stores html under key and returns its digest."""
+        body = html.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()
+        blob_path = self._blob_path(digest)
+        if os.path.exists(blob_path):
+            size = os.path.getsize(blob_path)
+        else:
+            data = self.compressor.compress(body)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            tmp_path = f'{blob_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as blob:
+                blob.write(data)
+            os.replace(tmp_path, blob_path)
+            size = len(data)
+            self.total_bytes += size
+
+        old = self.db.execute('SELECT digest FROM pages WHERE key = ?', (key,)).fetchone()
+        now = time.time()
+        self.db.execute('INSERT OR REPLACE INTO pages (key, digest, size, stored, accessed, etag, last_modified) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (key, digest, size, now, now, etag, last_modified))
+        self.db.commit()
+        if old and old[0] != digest:
+            self._release_blob(old[0])
+        self._evict()
+        return digest
+
+    def touch(self, key):
+        """Marks a stale entry fresh again after the server answered 304 Not Modified."""
+        self.db.execute('UPDATE pages SET stored = ? WHERE key = ?', (time.time(), key))
+        self.db.commit()
+
+    def processed_digest(self, key):
+        row = self.db.execute('SELECT digest FROM processed WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def mark_processed(self, key, digest):
+        self.db.execute('INSERT OR REPLACE INTO processed (key, digest) VALUES (?, ?)', (key, digest))
+        self.db.commit()
+
+    def _drop(self, key, digest):
+        self.db.execute('DELETE FROM pages WHERE key = ?', (key,))
+        self.db.commit()
+        self._release_blob(digest)
+
+    def _release_blob(self, digest):
+        """Deletes a blob once no key points at it any more."""
+        if self.db.execute('SELECT 1 FROM pages WHERE digest = ? LIMIT 1', (digest,)).fetchone():
+            return
+        blob_path = self._blob_path(digest)
+        try:
+            self.total_bytes -= os.path.getsize(blob_path)
+            os.remove(blob_path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        if self.total_bytes > self.max_bytes:
+            self.flush()  # Least recently used by the latest access times
+        while self.total_bytes > self.max_bytes:
+            row = self.db.execute('SELECT key, digest FROM pages ORDER BY accessed LIMIT 1').fetchone()
+            if row is None:
+                break
+            self._drop(*row)
+
+    async def fetch(self, url, loader, kind='http', accept=None):
+        """Returns the cached page for url or awaits loader() once for all concurrent callers.
+
+        A loaded page is stored only when accept(html) says so, pages that
+        accept turns down are handed back to the callers but never cached.
+        """
+        key = cache_key(url, kind)
+        while True:
+            html = await self.run(self.get, key)
+            if html is not None:
+                return html
+            if key not in self._inflight:
+                break
+            try:
+                return await asyncio.shield(self._inflight[key])
+            except _LoadAbandoned:
+                continue  # The loading caller was cancelled, one of its waiters takes over
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting, so mark a failure as retrieved to keep asyncio quiet
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._inflight[key] = future
+        try:
+            html = await loader()
+            future.set_result(html)
+            if html and (accept is None or accept(html)):
+                await self.run(self.put, key, html)
+            return html
+        except asyncio.CancelledError:
+            if not future.done():
+                # The waiters were not cancelled, they retry the load instead
+                future.set_exception(_LoadAbandoned())
+            raise
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            raise
+        finally:
+            del self._inflight[key]
+
+    def close(self):
+        self.flush()
+        self._io.shutdown(wait=True)
+        self.db.close()
+
+
+def get_page_cache():
+    """Returns the shared page cache, or None when caching is switched off."""
+    global _page_cache
+    if not PAGE_CACHE_ENABLED:
+        return None
+    if _page_cache is None:
+        _page_cache = PageCache()
+    return _page_cache
+
+
+def close_page_cache():
+    """Writes pending access times and closes the shared page cache."""
+    global _page_cache
+    if _page_cache is not None:
+        _page_cache.close()
+        _page_cache = None
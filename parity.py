@@ -0,0 +1,119 @@
+import argparse
+import io
+import sys
+from contextlib import redirect_stdout
+from urllib.parse import urlsplit
+
+from classifier import classify, PAGE_TYPES
+from page_cache import get_page_cache
+from parsers import BACKENDS, PARSERS, get_parser
+
+REFERENCE_BACKEND = 'soup'
+
+# Depth of the path under /size/ -> listing parser, anything deeper is a trim page
+LISTING_DEPTHS = {0: 'brands', 1: 'models', 2: 'trims'}
+
+
+def parser_for(url, html):
+    """Picks (parser name, extra args) for a saved page, None when no parser applies.
+
+    Pages read from files have no url and are taken for trim pages.
+    """
+    if url is not None:
+        slugs = [part for part in urlsplit(url).path.split('/') if part]
+        if not slugs or slugs[0] != 'size':
+            return None
+        name = LISTING_DEPTHS.get(len(slugs) - 1)
+        if name is not None:
+            return name, ()
+    page_type = PAGE_TYPES.get(classify(html))
+    if page_type is None:
+        return None
+    return 'trim_page', (page_type, 0)
+
+
+def run_backend(name, backend, html, args):
+    try:
+        with redirect_stdout(io.StringIO()):  # The reference parsers print their progress
+            return get_parser(name, backend)(html, *args)
+    except Exception as e:
+        return f'{type(e).__name__} raised'  # Both backends failing the same way counts as parity
+
+
+def first_difference(expected, actual, path=''):
+    """Returns the path of the first value that differs between two records, or None."""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in sorted(set(expected) | set(actual)):
+            difference = first_difference(expected.get(key), actual.get(key), f'{path}.{key}')
+            if difference:
+                return difference
+        return None
+    if isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            return f'{path} has {len(expected)} items against {len(actual)}'
+        for index, (left, right) in enumerate(zip(expected, actual)):
+            difference = first_difference(left, right, f'{path}[{index}]')
+            if difference:
+                return difference
+        return None
+    if expected != actual:
+        return f'{path or "result"}: {expected!r} != {actual!r}'
+    return None
+
+
+def check_page(name, html, args=(), backends=None):
+    """Parses one page with every backend, returns {backend: difference} for those that disagree."""
+    html = html.encode('utf-8') if isinstance(html, str) else html
+    expected = run_backend(name, REFERENCE_BACKEND, html, args)
+    mismatches = {}
+    for backend in backends or BACKENDS:
+        if backend == REFERENCE_BACKEND:
+            continue
+        difference = first_difference(expected, run_backend(name, backend, html, args))
+        if difference:
+            mismatches[backend] = difference
+    return mismatches
+
+
+def saved_pages(paths, kind=None):
+    """Yields (label, url, html) for the given files, or for every cached page without paths."""
+    if paths:
+        for path in paths:
+            with open(path, 'rb') as page:
+                yield path, None, page.read()
+        return
+    cache = get_page_cache()
+    for key in cache.keys():
+        html = cache.get(key, allow_stale=True)
+        if html is not None:
+            yield key, key.split(':', 1)[1], html
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Checks that every parser backend matches the BeautifulSoup one.')
+    parser.add_argument('paths', nargs='*', help='saved pages, the whole page cache when left out')
+    parser.add_argument('--parser', choices=PARSERS, help='parser for the given files, by default picked from the url')
+    parser.add_argument('--page-type', type=int, choices=(1, 2, 3), help='trim page layout for --parser trim_page')
+    args = parser.parse_args(argv)
+
+    checked = failed = 0
+    for label, url, html in saved_pages(args.paths):
+        if args.parser:
+            name = args.parser
+            extra = (args.page_type or PAGE_TYPES.get(classify(html)), 0) if name == 'trim_page' else ()
+        else:
+            picked = parser_for(url, html)
+            if picked is None:
+                continue
+            name, extra = picked
+        checked += 1
+        for backend, difference in check_page(name, html, extra).items():
+            failed += 1
+            print(f'{label} [{name}] {backend}: {difference}')
+
+    print(f'{checked} pages checked, {failed} mismatches')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import lxml_parsers
+import soup_parsers
+
+PARSE_WORKERS = os.cpu_count() or 2
+PARSE_IN_PROCESS = True  # False parses on the event loop thread, handy when debugging a parser
+PARSER_BACKEND = 'soup'  # 'lxml' is faster, switch once tests/test_parity.py covers the live pages
+
+# Every backend module provides parse_<name>(html, *args) for each of PARSERS
+PARSERS = ('brands', 'models', 'trims', 'trim_page')
+BACKENDS = {
+    'soup': soup_parsers,
+    'lxml': lxml_parsers,
+}
+
+_parse_executor = None
+
+
+def configure_parse_executor(workers=PARSE_WORKERS):
+    """Sizes the process pool that parses pages, one process per core by default."""
+    global _parse_executor
+    if _parse_executor is not None:
+        _parse_executor.shutdown(wait=False)
+    _parse_executor = ProcessPoolExecutor(max_workers=workers)
+    return _parse_executor
+
+
+def shutdown_parse_executor():
+    global _parse_executor
+    if _parse_executor is not None:
+        _parse_executor.shutdown(wait=True)
+        _parse_executor = None
+
+
+def get_parser(name, backend=None):
+    return getattr(BACKENDS[backend or PARSER_BACKEND], f'parse_{name}')
+
+
+async def run_parser(name, html, *args, backend=None):
+    """Runs a page parser on the process pool and awaits its records.
+
+    The page crosses the process boundary as bytes, the parser sends back
+    plain dicts and lists, so neither side pickles a DOM.
+    """
+    parser = get_parser(name, backend)
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+    if not PARSE_IN_PROCESS:
+        return parser(html, *args)
+    if _parse_executor is None:
+        configure_parse_executor()
+    return await asyncio.get_running_loop().run_in_executor(_parse_executor, parser, html, *args)
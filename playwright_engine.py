@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+from fake_useragent import UserAgent
+from playwright.async_api import async_playwright, Error as PlaywrightError, TimeoutError as PlaywrightTimeout
+
+from base import LEAN_MODE, MUTATION_OBSERVER_JS, READY_POLL_INTERVAL, ready_expression
+from retry import BrowserError
+from session_store import load_session, save_session, drop_session
+
+BLOCKED_RESOURCE_TYPES = {'image', 'font', 'stylesheet', 'media'}
+BLOCKED_HOSTS = ('googletagmanager.com', 'google-analytics.com', 'doubleclick.net', 'googlesyndication.com',
+                 'adservice.google.', 'amazon-adsystem.com', 'facebook.net', 'hotjar.com',
+                 'scorecardresearch.com', 'quantserve.com')
+
+
+async def block_heavy_resources(route):
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or any(host in request.url for host in BLOCKED_HOSTS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+class PlaywrightContext:
+    """An isolated browser context with its own proxy, cookies and user agent.
+
+    Offers the page-fetch contract base.get relies on, so it can stand in
+    for a Selenium driver in BrowserPool and modifications.
+    """
+
+    def __init__(self, context, proxy=None, user_agent=None):
+        self.context = context
+        self.proxy = proxy
+        self.user_agent = user_agent
+        self.pages_served = 0
+        self.started_at = time.monotonic()
+        self.captured_responses = []
+
+    async def fetch_html(self, url, timeout=30, page_type='trim'):
+        """Loads url in a fresh tab, waits until it is ready the way wait_until_ready does and returns the HTML."""
+        self.pages_served += 1
+        page = await self.context.new_page()
+        try:
+            await page.goto(str(url), wait_until='domcontentloaded', timeout=timeout * 1000)
+            # scroll to the bottom of the page to load all elements
+            await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+            await page.evaluate(f"() => {{ {MUTATION_OBSERVER_JS} }}")  # A function, as the script holds statements
+            await page.wait_for_function(ready_expression(page_type),
+                                         polling=int(READY_POLL_INTERVAL * 1000), timeout=timeout * 1000)
+            return await page.content()
+        except PlaywrightTimeout as e:
+            raise asyncio.TimeoutError(str(e)) from e
+        except PlaywrightError as e:
+            raise BrowserError(str(e)) from e
+        finally:
+            await page.close()
+
+    async def close(self, session='save'):
+        """Closes the context, saving, dropping or keeping its session like base.close_browser."""
+        if session == 'save':
+            try:
+                state = await self.context.storage_state()
+                state['user_agent'] = self.user_agent
+                save_session(self.proxy, state)
+            except PlaywrightError as e:
+                print(f"Failed to save browser session: {e}")
+        elif session == 'drop':
+            drop_session(self.proxy)
+        try:
+            await self.context.close()
+        except PlaywrightError as e:
+            print(f"Failed to close browser context: {e}")
+
+
+class PlaywrightEngine:
+    """One headless Chromium process serving many isolated contexts."""
+
+    def __init__(self):
+        self.playwright = None
+        self.browser = None
+
+    async def start(self):
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(
+            headless=True,
+            args=["--no-sandbox", "--disable-dev-shm-usage", "--disable-blink-features=AutomationControlled"],
+            # Chromium only honours per-context proxies when launched with a placeholder one,
+            # so every context sets its own, direct:// for contexts without a proxy
+            proxy={'server': 'http://per-context'},
+        )
+        return self
+
+    async def new_context(self, proxy=None):
+        session = load_session(proxy)  # Cookies, localStorage and user agent from earlier contexts
+        user_agent = session.get('user_agent') if session else None
+        user_agent = user_agent or UserAgent().random
+        storage_state = {'cookies': session.get('cookies', []), 'origins': session.get('origins', [])} \
+            if session else None
+        context = await self.browser.new_context(
+            user_agent=user_agent,
+            storage_state=storage_state,
+            proxy={'server': proxy or 'direct://'},
+            viewport={'width': 1920, 'height': 1080},
+            ignore_https_errors=True,
+        )
+        if LEAN_MODE:
+            await context.route('**/*', block_heavy_resources)
+        return PlaywrightContext(context, proxy, user_agent)
+
+    async def close(self):
+        if self.browser is not None:
+            await self.browser.close()
+        if self.playwright is not None:
+            await self.playwright.stop()
@@ -1,22 +1,241 @@
 import random
+import time
 from concurrent.futures import ThreadPoolExecutor
 
+import aiohttp
 from Proxy_List_Scrapper import Scrapper
 from fp.fp import FreeProxy
 import asyncio
 
+from database import SessionLocal, add_proxy, get_usable_proxies, get_proxy, update_proxy_stats, \
+    mark_proxy_as_failed
+
 MAX_WORKERS = 5
+
+LATENCY_ALPHA = 0.3  # Weight of the newest sample in the latency EWMA
+BASE_COOLDOWN = 60  # Seconds a proxy sits out after its first ban, doubled on every next one
+MAX_COOLDOWN = 6 * 60 * 60
+DEAD_AFTER_FAILURES = 10  # Failures without a single success before a proxy is dropped for good
+
+# Background harvesting
+PROBE_URL = 'https://www.wheel-size.com/robots.txt'  # Small page on the crawled site
+PROBE_TIMEOUT = 10
+VALIDATION_CONCURRENCY = 50
+TARGET_AVAILABLE = 20  # Harvest whenever fewer proxies than this are ready to use
+HARVEST_INTERVAL = 120  # Seconds between harvests while the pool is well stocked
+
+# Scraping proxy lists is blocking, so it runs on this one shared executor
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+
 def get_fresh_proxy():
     return Scrapper(category='ALL', print_err_trace=False).getProxies().proxies
 
 
 async def get_free_proxy_async(semaphore, max_workers=MAX_WORKERS):
     async with semaphore:
-        loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor(max_workers=max_workers) as pool:
-            while True:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                return await loop.run_in_executor(_executor, get_fresh_proxy)
+            except Exception as e:
+                print(f'Error while getting proxy: {e}')
+                await asyncio.sleep(1)
+
+
+def proxy_url(proxy):
+    return f'http://{proxy.ip}:{proxy.port}'
+
+
+class ProxyPool:
+    """Proxies from the proxies table, picked at random weighted by their score.
+
+    Every proxy keeps its success and failure counts, a latency EWMA and a
+    ban count. A banned proxy is benched for an exponentially growing
+    cooldown instead of being dropped, only proxies that never worked are
+    marked as failed.
+    """
+
+    def __init__(self):
+        self.proxies = {}  # proxy url -> Proxy row
+        self.changed = asyncio.Event()
+        self.starving = asyncio.Event()  # Set when acquire found nothing to hand out
+        self.lock = asyncio.Lock()
+
+    async def load(self):
+        async with SessionLocal() as db:
+            for proxy in await get_usable_proxies(db):
+                self.proxies[proxy_url(proxy)] = proxy
+        self.changed.set()
+        return self
+
+    async def add(self, ip, port):
+        """Stores a new proxy and makes it available right away."""
+        async with SessionLocal() as db:
+            await add_proxy(db, ip, str(port))
+            proxy = await get_proxy(db, ip)
+        if proxy is not None and not proxy.failed:
+            self.proxies.setdefault(proxy_url(proxy), proxy)
+            self.changed.set()
+
+    @staticmethod
+    def score(proxy):
+        successes = proxy.successes or 0
+        failures = proxy.failures or 0
+        success_rate = (successes + 1) / (successes + failures + 2)
+        latency = proxy.latency_ewma or 1.0
+        return success_rate / (latency * (1 + (proxy.bans or 0)))
+
+    def available(self):
+        now = time.time()
+        return [proxy for proxy in self.proxies.values() if (proxy.cooldown_until or 0) <= now]
+
+    def is_benched(self, url):
+        """True for a proxy that is cooling down after a ban or was dropped as failed."""
+        if url is None:
+            return False
+        proxy = self.proxies.get(url)
+        return proxy is None or (proxy.cooldown_until or 0) > time.time()
+
+    async def acquire(self, timeout=None):
+        """Returns the url of a proxy that is not cooling down, or None if none shows up in time."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            candidates = self.available()
+            if not candidates:
+                self.starving.set()
+            else:
+                proxy = random.choices(candidates, weights=[self.score(proxy) for proxy in candidates])[0]
+                return proxy_url(proxy)
+
+            # Sleep until the next cooldown ends or a new proxy is added
+            now = time.time()
+            wake_at = [proxy.cooldown_until - now for proxy in self.proxies.values()]
+            wait = min(wake_at) if wake_at else None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                wait = min(wait, remaining) if wait is not None else remaining
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _save(self, proxy):
+        async with self.lock:
+            async with SessionLocal() as db:
+                await update_proxy_stats(db, proxy)
+
+    async def report_success(self, url, latency):
+        proxy = self.proxies.get(url)
+        if proxy is None:
+            return
+        proxy.successes = (proxy.successes or 0) + 1
+        if proxy.latency_ewma is None:
+            proxy.latency_ewma = latency
+        else:
+            proxy.latency_ewma = LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * proxy.latency_ewma
+        await self._save(proxy)
+
+    async def report_failure(self, url):
+        proxy = self.proxies.get(url)
+        if proxy is None:
+            return
+        proxy.failures = (proxy.failures or 0) + 1
+        if not proxy.successes and proxy.failures >= DEAD_AFTER_FAILURES:
+            proxy.failed = True
+            del self.proxies[url]
+            async with self.lock:
+                async with SessionLocal() as db:
+                    await mark_proxy_as_failed(db, proxy)
+            return
+        await self._save(proxy)
+
+    async def ban(self, url):
+        """Benches a proxy the site blocked, longer with every ban."""
+        proxy = self.proxies.get(url)
+        if proxy is None:
+            return
+        proxy.bans = (proxy.bans or 0) + 1
+        proxy.failures = (proxy.failures or 0) + 1
+        cooldown = min(MAX_COOLDOWN, BASE_COOLDOWN * 2 ** (proxy.bans - 1))
+        proxy.cooldown_until = time.time() + cooldown
+        print(f'Proxy {url} banned {proxy.bans} times, benched for {cooldown}s')
+        await self._save(proxy)
+
+
+class ProxyHarvester:
+    """Keeps the proxy pool stocked from a background task.
+
+    Candidates scraped from public lists are probed concurrently through
+    aiohttp, the ones that reach PROBE_URL unblocked join the pool before
+    any worker asks for them. Harvests run every HARVEST_INTERVAL seconds
+    while fewer than TARGET_AVAILABLE proxies are ready, and immediately
+    when the pool runs dry.
+    """
+
+    def __init__(self, pool, probe_url=PROBE_URL, target=TARGET_AVAILABLE, interval=HARVEST_INTERVAL,
+                 concurrency=VALIDATION_CONCURRENCY):
+        self.pool = pool
+        self.probe_url = probe_url
+        self.target = target
+        self.interval = interval
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.session = None
+        self.task = None
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=PROBE_TIMEOUT))
+        self.task = asyncio.create_task(self._run())
+        return self
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.session is not None:
+            await self.session.close()
+
+    async def _run(self):
+        while True:
+            if len(self.pool.available()) < self.target:
                 try:
-                    return await loop.run_in_executor(pool, get_fresh_proxy)
+                    await self.harvest()
                 except Exception as e:
-                    print(f'Error while getting proxy: {e}')
-                    await asyncio.sleep(1)
\ No newline at end of file
+                    print(f'Proxy harvest failed: {e}')
+            self.pool.starving.clear()
+            try:
+                await asyncio.wait_for(self.pool.starving.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def harvest(self):
+        loop = asyncio.get_running_loop()
+        candidates = await loop.run_in_executor(_executor, get_fresh_proxy)
+        fresh = [(candidate.ip, candidate.port) for candidate in candidates
+                 if f'http://{candidate.ip}:{candidate.port}' not in self.pool.proxies]
+        results = await asyncio.gather(*(self.validate(ip, port) for ip, port in fresh))
+        print(f'Proxy harvest: {sum(results)} of {len(fresh)} new candidates passed validation')
+
+    async def validate(self, ip, port):
+        url = f'http://{ip}:{port}'
+        async with self.semaphore:
+            started = time.monotonic()
+            try:
+                async with self.session.get(self.probe_url, proxy=url) as response:
+                    body = await response.text()
+                    if response.status != 200 or 'access denied' in body.lower():
+                        return False
+            except Exception:
+                return False
+        await self.pool.add(ip, port)
+        await self.pool.report_success(url, time.monotonic() - started)
+        return True
+
+
+proxy_pool = ProxyPool()
@@ -0,0 +1,80 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+INITIAL_RATE = 0.5  # Requests per second a new host/proxy pair starts with
+MIN_RATE = 0.05
+MAX_RATE = 10.0
+ADDITIVE_STEP = 0.05  # Rate added after every successful response
+BACKOFF_FACTOR = 0.5  # Rate multiplier applied when the site blocks us
+BURST = 2  # Tokens a bucket can save up while idle
+
+
+class TokenBucket:
+    """Token bucket whose refill rate can be changed on the fly."""
+
+    def __init__(self, rate=INITIAL_RATE, capacity=BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def set_rate(self, rate):
+        self._refill()
+        self.rate = rate
+
+
+class AdaptiveRateLimiter:
+    """Per host and proxy token buckets tuned with AIMD.
+
+    Each success raises the rate by ADDITIVE_STEP, each block multiplies it
+    by BACKOFF_FACTOR and empties the bucket, so we settle just under the
+    rate the site tolerates.
+    """
+
+    def __init__(self, initial_rate=INITIAL_RATE, min_rate=MIN_RATE, max_rate=MAX_RATE,
+                 step=ADDITIVE_STEP, factor=BACKOFF_FACTOR, burst=BURST):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.step = step
+        self.factor = factor
+        self.burst = burst
+        self.buckets = {}
+
+    def bucket(self, url, proxy=None):
+        key = (urlsplit(str(url)).hostname, proxy)
+        if key not in self.buckets:
+            self.buckets[key] = TokenBucket(self.initial_rate, self.burst)
+        return self.buckets[key]
+
+    async def acquire(self, url, proxy=None):
+        await self.bucket(url, proxy).acquire()
+
+    def success(self, url, proxy=None):
+        bucket = self.bucket(url, proxy)
+        bucket.set_rate(min(self.max_rate, bucket.rate + self.step))
+
+    def blocked(self, url, proxy=None):
+        bucket = self.bucket(url, proxy)
+        bucket.set_rate(max(self.min_rate, bucket.rate * self.factor))
+        bucket.tokens = 0
+        print(f"Blocked on {url} via {proxy}, rate lowered to {bucket.rate:.2f} req/s")
+
+
+limiter = AdaptiveRateLimiter()
@@ -0,0 +1,182 @@
+import asyncio
+import random
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import aiohttp
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+BASE_DELAY = 1.0  # Seconds, doubled on every attempt before jitter
+MAX_DELAY = 60.0
+
+# Error class -> attempts allowed before the error is raised to the caller
+RETRY_BUDGETS = {
+    'blocked': 2,
+    'timeout': 3,
+    'connection': 4,
+    'server': 4,
+    'client': 1,
+    'browser': 1,
+    'other': 2,
+}
+
+# Error classes that tell about one driver rather than the host, they count on the
+# host + proxy breaker only
+DRIVER_ERRORS = ('browser',)
+
+BREAKER_THRESHOLD = 5  # Consecutive failures that open a host + proxy breaker
+HOST_BREAKER_THRESHOLD = 15  # Consecutive failures across all proxies that open a host breaker
+BREAKER_COOLDOWN = 30  # Seconds an open breaker waits before letting one probe through
+MAX_BREAKER_COOLDOWN = 15 * 60
+
+
+class BlockedError(Exception):
+    """The site answered with a 403, 429 or an access denied page."""
+
+
+class BrowserError(Exception):
+    """A browser engine other than Selenium failed to load a page, or a page never got ready in time."""
+
+
+def classify_error(error):
+    if isinstance(error, BlockedError):
+        return 'blocked'
+    if isinstance(error, aiohttp.ClientResponseError):
+        if error.status in (403, 429):
+            return 'blocked'
+        return 'server' if error.status >= 500 else 'client'
+    if isinstance(error, (asyncio.TimeoutError, TimeoutException)):
+        return 'timeout'
+    if isinstance(error, aiohttp.ClientConnectionError):
+        return 'connection'
+    if isinstance(error, (WebDriverException, BrowserError)):
+        return 'browser'
+    return 'other'
+
+
+class CircuitBreaker:
+    """Stops all callers for a while after repeated failures.
+
+    Once open, every caller waits out the cooldown, then a single probe is
+    let through: success closes the breaker, failure opens it again with a
+    doubled cooldown.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probe = asyncio.Lock()
+        self.prober = None  # Task holding the half-open probe
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    async def wait(self):
+        while self.is_open:
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+                continue
+            if not self.probe.locked():
+                # Half-open: this caller is the probe, the rest keep waiting on it
+                await self.probe.acquire()
+                self.prober = asyncio.current_task()
+                return
+            async with self.probe:
+                pass
+
+    def _is_prober(self):
+        return self.prober is not None and self.prober is asyncio.current_task()
+
+    def _release_probe(self):
+        if self._is_prober():
+            self.prober = None
+            self.probe.release()
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.cooldown = self.base_cooldown
+        self._release_probe()
+
+    def abandon(self):
+        """Lets the next waiter probe when this caller was cancelled, without counting a failure."""
+        self._release_probe()
+
+    def failure(self):
+        self.failures += 1
+        if self.is_open:
+            if self._is_prober():
+                # The half-open probe failed
+                self.cooldown = min(MAX_BREAKER_COOLDOWN, self.cooldown * 2)
+                self.opened_at = time.monotonic()
+        elif self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self._release_probe()
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, retry budgets per error class and
+    circuit breakers per host and per host + proxy, shared by the HTTP and
+    Selenium fetch paths."""
+
+    def __init__(self, budgets=None, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.budgets = budgets or RETRY_BUDGETS
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breakers = {}
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def breakers_for(self, url, proxy=None):
+        host = urlsplit(str(url)).hostname
+        keys = [((host, proxy), BREAKER_THRESHOLD), ((host, '*'), HOST_BREAKER_THRESHOLD)]
+        for key, threshold in keys:
+            if key not in self.breakers:
+                self.breakers[key] = CircuitBreaker(threshold)
+        return [self.breakers[key] for key, _ in keys]
+
+    async def run(self, url, proxy, operation, max_attempts=None):
+        """Awaits operation() until it succeeds, its error class runs out of budget
+        or max_attempts is reached, then raises the last error."""
+        breakers = self.breakers_for(url, proxy)
+        spent = Counter()
+        attempt = 0
+        while True:
+            try:
+                for breaker in breakers:
+                    await breaker.wait()
+                result = await operation()
+            except asyncio.CancelledError:
+                for breaker in breakers:
+                    breaker.abandon()
+                raise
+            except Exception as e:
+                error_class = classify_error(e)
+                host_breaker = breakers[-1]
+                for breaker in breakers:
+                    if breaker is host_breaker and error_class in DRIVER_ERRORS:
+                        breaker.abandon()
+                    else:
+                        breaker.failure()
+                spent[error_class] += 1
+                attempt += 1
+                if spent[error_class] >= self.budgets.get(error_class, 1) or \
+                        (max_attempts is not None and attempt >= max_attempts):
+                    raise
+                delay = self.delay(attempt)
+                print(f"{error_class} error on {url} ({e!r}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            else:
+                for breaker in breakers:
+                    breaker.success()
+                return result
+
+
+retry_policy = RetryPolicy()
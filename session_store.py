@@ -0,0 +1,122 @@
+import json
+import os
+import re
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit
+
+SESSION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.sessions')
+
+# Cookie fields shared by CDP and Playwright storage_state, with defaults for missing ones
+COOKIE_DEFAULTS = {'path': '/', 'expires': -1, 'httpOnly': False, 'secure': False, 'sameSite': 'Lax'}
+
+_sessions = {}  # proxy -> state, mirrors what is on disk
+
+# Re-creates saved localStorage items before the site's own scripts run
+LOCAL_STORAGE_JS = """
+(function (origins) {
+    var items = origins[location.origin];
+    if (!items) { return; }
+    items.forEach(function (item) {
+        if (localStorage.getItem(item.name) === null) {
+            localStorage.setItem(item.name, item.value);
+        }
+    });
+})(%s);
+"""
+
+
+def session_path(proxy):
+    name = re.sub(r'[^\w.-]+', '_', proxy) if proxy else 'direct'
+    return os.path.join(SESSION_DIR, name + '.json')
+
+
+def load_session(proxy):
+    """Returns the saved state for a proxy: user_agent, cookies and origins, or None.
+
+    The state uses Playwright's storage_state layout so both engines can read it.
+    """
+    if proxy in _sessions:
+        return _sessions[proxy]
+    try:
+        with open(session_path(proxy), encoding='utf-8') as file:
+            state = json.load(file)
+    except (OSError, ValueError):
+        state = None
+    _sessions[proxy] = state
+    return state
+
+
+def save_session(proxy, state):
+    if not state:
+        return
+    _sessions[proxy] = state
+    os.makedirs(SESSION_DIR, exist_ok=True)
+    path = session_path(proxy)
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(state, file)
+    os.replace(path + '.tmp', path)
+
+
+def drop_session(proxy):
+    """Forgets the saved state of a proxy the site flagged, so the next driver starts clean."""
+    _sessions[proxy] = None
+    try:
+        os.remove(session_path(proxy))
+    except OSError:
+        pass
+
+
+def capture_selenium_state(driver):
+    """Reads cookies for every domain, the current origin's localStorage and the user agent. Blocking."""
+    cookies = driver.execute_cdp_cmd('Network.getAllCookies', {}).get('cookies', [])
+    storage = driver.execute_script(
+        "try { return {origin: location.origin, items: Object.assign({}, localStorage)}; }"
+        " catch (e) { return null; }"
+    )
+    origins = []
+    if storage and storage.get('origin', 'null') != 'null':
+        origins.append({'origin': storage['origin'],
+                        'localStorage': [{'name': name, 'value': value} for name, value in storage['items'].items()]})
+    return {
+        'user_agent': getattr(driver, 'user_agent', None),
+        'cookies': [{'name': cookie['name'], 'value': cookie['value'], 'domain': cookie['domain'],
+                     **{field: cookie.get(field, default) for field, default in COOKIE_DEFAULTS.items()}}
+                    for cookie in cookies],
+        'origins': origins,
+    }
+
+
+def restore_selenium_state(driver, state):
+    """Loads saved cookies and localStorage into a fresh driver. Blocking."""
+    cookies = []
+    for cookie in state.get('cookies', []):
+        cookie = dict(cookie)
+        if cookie.get('expires', -1) < 0:
+            cookie.pop('expires', None)  # Session cookie
+        cookies.append(cookie)
+    if cookies:
+        driver.execute_cdp_cmd('Network.setCookies', {'cookies': cookies})
+    origins = {origin['origin']: origin['localStorage'] for origin in state.get('origins', [])}
+    if origins:
+        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument',
+                               {'source': LOCAL_STORAGE_JS % json.dumps(origins)})
+
+
+def http_session_state(proxy, url):
+    """Returns (user agent, cookies) from the proxy's saved session that apply to url."""
+    state = load_session(proxy)
+    if not state:
+        return None, None
+    parts = urlsplit(str(url))
+    host = parts.hostname or ''
+    cookies = SimpleCookie()
+    for cookie in state.get('cookies', []):
+        domain = cookie.get('domain', '').lstrip('.')
+        if not (host == domain or host.endswith('.' + domain)):
+            continue
+        if not parts.path.startswith(cookie.get('path', '/')):
+            continue
+        if cookie.get('secure') and parts.scheme != 'https':
+            continue
+        cookies[cookie['name']] = cookie['value']
+    return state.get('user_agent'), cookies or None
@@ -0,0 +1,155 @@
+import zlib
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+from lxml import etree
+
+from base import get_session, READ_CHUNK_SIZE
+from database import seed_brands, seed_models, seed_trims
+from ratelimit import limiter
+
+SITEMAP_INDEX_URL = 'https://www.wheel-size.com/sitemap.xml'
+SITE_URL = 'https://www.wheel-size.com'
+SEED_BATCH = 500  # Rows per INSERT OR IGNORE statement
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Depth of the path under /size/ -> catalog level
+LEVELS = {1: 'brand', 2: 'model', 3: 'trim'}
+
+
+class CatalogUrl(NamedTuple):
+    level: str
+    url: str
+    slugs: tuple
+
+
+def classify_url(url):
+    """Returns the CatalogUrl for a /size/ page of the catalog, None for anything else."""
+    parts = urlsplit(url)
+    slugs = tuple(part for part in parts.path.split('/') if part)
+    if not slugs or slugs[0] != 'size':
+        return None
+    level = LEVELS.get(len(slugs) - 1)
+    if level is None:
+        return None
+    return CatalogUrl(level, SITE_URL + '/' + '/'.join(slugs) + '/', slugs[1:])
+
+
+def name_from_slug(slug):
+    # The sitemap carries no names, listing pages replace them when they are crawled
+    return slug.replace('-', ' ').replace('_', ' ').title()
+
+
+async def stream_locs(url, session=None):
+    """Yields (kind, loc) for every <loc> of a sitemap, kind being 'sitemap' or 'url'.
+
+    The document is parsed as its chunks arrive, gzipped sitemaps are
+    inflated on the fly and finished entries are dropped from the tree, so
+    memory stays flat however large the file is.
+    """
+    session = session or get_session()
+    parser = etree.XMLPullParser(events=('end',), resolve_entities=False, no_network=True, huge_tree=True)
+    inflater = None
+
+    await limiter.acquire(url)
+    print(f'Streaming sitemap {url}')
+    async with session.get(url) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+            if inflater is None:
+                inflater = zlib.decompressobj(zlib.MAX_WBITS | 16) if chunk.startswith(GZIP_MAGIC) else False
+            if inflater:
+                chunk = inflater.decompress(chunk)
+            parser.feed(chunk)
+            for loc in drain_locs(parser):
+                yield loc
+        if inflater:
+            parser.feed(inflater.flush())
+        parser.close()
+        for loc in drain_locs(parser):
+            yield loc
+    limiter.success(url)
+
+
+def drain_locs(parser):
+    for _, element in parser.read_events():
+        tag = etree.QName(element).localname
+        if tag == 'loc':
+            kind = etree.QName(element.getparent()).localname
+            if element.text:
+                yield ('sitemap' if kind == 'sitemap' else 'url'), element.text.strip()
+        elif tag in ('url', 'sitemap'):
+            # Drop finished entries so the tree never grows past one of them
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+async def discover_catalog(index_url=SITEMAP_INDEX_URL, session=None):
+    """Walks the sitemap index and its sitemaps, yielding every catalog page found."""
+    pending = [index_url]
+    seen = set()
+    while pending:
+        sitemap_url = pending.pop(0)
+        if sitemap_url in seen:
+            continue
+        seen.add(sitemap_url)
+        try:
+            async for kind, loc in stream_locs(sitemap_url, session=session):
+                if kind == 'sitemap':
+                    pending.append(loc)
+                    continue
+                page = classify_url(loc)
+                if page is not None:
+                    yield page
+        except Exception as e:
+            print(f'Error while streaming sitemap {sitemap_url}: {e}')
+
+
+async def seed_from_sitemap(db, index_url=SITEMAP_INDEX_URL, session=None, enrich=False):
+    """Seeds brands, models and trims straight from the sitemap.
+
+    Without enrich the seeded brands and models are marked processed, so
+    the crawl goes straight to the trims. With enrich their listing pages
+    are still fetched, only to fill in names, years and regions the sitemap
+    lacks. Returns how many urls of each level were seen.
+    """
+    brands = {}
+    models = {}
+    trims = {}
+    async for page in discover_catalog(index_url, session=session):
+        if page.level == 'brand':
+            brands[page.slugs] = page.url
+        elif page.level == 'model':
+            models[page.slugs] = page.url
+        else:
+            trims[page.slugs] = page.url
+
+    # Parents missing from the sitemap are implied by their children's urls
+    for slugs in list(trims):
+        models.setdefault(slugs[:2], SITE_URL + '/size/' + '/'.join(slugs[:2]) + '/')
+    for slugs in list(models):
+        brands.setdefault(slugs[:1], SITE_URL + '/size/' + slugs[0] + '/')
+
+    processed = not enrich
+    brand_ids = await seed_brands(db, [
+        {'name': name_from_slug(slugs[-1]), 'url': url, 'processed': processed}
+        for slugs, url in brands.items()
+    ], batch=SEED_BATCH)
+    model_rows = []
+    for slugs, url in models.items():
+        brand_id = brand_ids.get(brands[slugs[:1]])
+        if brand_id is not None:  # None when an existing brand already holds the name
+            model_rows.append({'name': name_from_slug(slugs[-1]), 'url': url, 'processed': processed,
+                               'brand_id': brand_id})
+    model_ids = await seed_models(db, model_rows, batch=SEED_BATCH)
+    trim_rows = []
+    for slugs, url in trims.items():
+        model_id = model_ids.get(models[slugs[:2]])
+        if model_id is not None:
+            trim_rows.append({'name': name_from_slug(slugs[-1]), 'url': url, 'model_id': model_id})
+    await seed_trims(db, trim_rows, batch=SEED_BATCH)
+
+    counts = {'brand': len(brands), 'model': len(models), 'trim': len(trims)}
+    print(f'Sitemap seeded {counts}')
+    return counts
@@ -0,0 +1,411 @@
+import re
+from collections import defaultdict
+
+from bs4 import BeautifulSoup, NavigableString, SoupStrainer
+
+SITE_URL = 'https://www.wheel-size.com'
+STRAIN_LISTINGS = True  # Build only the subtrees the listing parsers read
+
+# Listing parser -> the nodes it reads, everything outside them is skipped while parsing
+LISTING_STRAINERS = {
+    'brands': SoupStrainer(class_='brand-link-item'),
+    'models': SoupStrainer(class_='market-item'),
+    'trims': SoupStrainer('div', class_='market-generation'),
+}
+
+
+def make_soup(html, parse_only=None):
+    return BeautifulSoup(html, 'html.parser', parse_only=parse_only,
+                         from_encoding='utf-8' if isinstance(html, bytes) else None)
+
+
+def make_listing_soup(html, listing):
+    return make_soup(html, LISTING_STRAINERS[listing] if STRAIN_LISTINGS else None)
+
+
+def parse_brands(html):
+    soup = make_listing_soup(html, 'brands')
+    return [
+        {'name': make.select_one('.brand-name').get_text(), 'url': SITE_URL + make['href']}
+        for make in soup.select('.brand-link-item')
+    ]
+
+
+def parse_models(html):
+    soup = make_listing_soup(html, 'models')
+    return [
+        {'name': model.select_one('.model-name').text.strip(), 'url': SITE_URL + model['href']}
+        for model in soup.select('.market-item a')
+    ]
+
+
+def parse_trims(html):
+    soup = make_listing_soup(html, 'trims')
+    trims = []
+    for section in soup.find_all('div', class_='market-generation'):
+        link = section.find('a', title=True)
+        if link:
+            title_text = link['title']
+            print(title_text)
+            name_part = title_text.split(':')[-1].strip()
+
+            name = name_part
+            year_from = None
+            year_to = None
+
+            if '[' in name_part and ']' in name_part:
+                try:
+                    name, years = name_part.split('[')
+                    years = years.strip(']').split('..')
+                    year_from = int(years[0].strip())
+                    year_to = int(years[1].strip()) if len(years) > 1 else None
+                except ValueError as ve:
+                    print(f"Error parsing years from {name_part}: {ve}")
+            elif '..' in name_part:
+                try:
+                    name, years = name_part.split('..')
+                    year_from = int(name.split()[-1])
+                    name = ' '.join(name.split()[:-1]).strip()
+                    year_to = int(years.strip())
+                except ValueError as ve:
+                    print(f"Error parsing years from {name_part}: {ve}")
+            else:
+                print(f"Invalid format for name and years: {name_part}")
+                continue
+
+            url = SITE_URL + link['href']
+
+            regions = []
+            region_elements = section.find_all('span', class_='badge border border-secondary text-secondary mb-1')
+            for region in region_elements:
+                regions.append(region.text.strip())
+
+            trims.append({'name': name.strip(), 'year_from': year_from, 'year_to': str(year_to), 'url': url,
+                          'regions': regions})
+    return trims
+
+
+def parse_trim_page(html, page_type, trim_id, require_complete=False):
+    """Parses a trim page into {'modifications': [...], 'region_urls': [...]}.
+
+    With require_complete, returns None when the server HTML lacks what the
+    parser reads, so the page can be rendered in a browser instead.
+    """
+    soup = make_soup(html)
+    if require_complete and not is_page_complete(soup, page_type):
+        return None
+    if page_type == 2:
+        return {'modifications': [], 'region_urls': parse_region_urls(soup)}
+    return {'modifications': parse_modifications(soup, trim_id), 'region_urls': []}
+
+
+def is_page_complete(soup: BeautifulSoup, page_type) -> bool:
+    """Checks that the server HTML already has everything the page type parser reads."""
+    if page_type == 2:
+        return soup.find('div', class_='market-filter') is not None
+    if page_type in (1, 3):
+        if not soup.find('div', class_='data-parameters') or not soup.find('tbody'):
+            return False
+        if soup.find('i', class_='fa-spinner'):
+            return False
+        # Values such as Thread Size are filled in by scripts on the live page
+        return all(span.get_text(strip=True)
+                   for param in soup.find_all('li', class_='element-parameter')
+                   for span in param.find_all('span', id=True))
+    return False
+
+
+def parse_modifications(soup: BeautifulSoup, trim_id: int) -> list:
+    modifications = []
+    panels = index_ids(soup)
+    # Логіка парсингу для типу сторінки 1
+    engine_sections = soup.find_all('div', class_='panel-content')
+    for engine_section in engine_sections:
+        fuel_types = engine_section.find_all('div', class_='mt-2')
+        for fuel_type in fuel_types:
+            modifications_links = fuel_type.find_all('a', class_='js-scroll-trigger')
+            for link in modifications_links:
+                power = link.find('span',
+                                  class_='position-absolute pos-top pos-right mr-1 fs-sm font-weight-light').text.strip()
+                href = link['href']
+                panel_id = href.split('#')[-1]
+
+                print(f"Fetching modification data for Href: {href}")
+                panel_div = panels.get(panel_id)
+                if not panel_div:
+                    print(f"Panel with id {panel_id} not found for URL: {href}")
+                    continue
+
+                modification_soup = find_panel_content(panel_div)
+
+                if not modification_soup:
+                    print(f"Modification data not found for panel id: {panel_id}")
+                    continue
+
+                modification_info = parse_modification_info(modification_soup)
+
+                modifications.append({
+                    'trim_id': trim_id,
+                    'name': link.find('span', class_='position-relative').text.strip(),
+                    'year_from': int(modification_info['year_from']),
+                    'year_to': str(modification_info['year_to']),
+                    'regions': modification_info['regions'],
+                    'url': SITE_URL + href,
+                    'engine': modification_info['engine'],
+                    'power': power,
+                    'center_bore_hub_bore': modification_info['center_bore_hub_bore'],
+                    'bolt_pattern_pcd': modification_info['bolt_pattern_pcd'],
+                    'wheel_fasteners': modification_info['wheel_fasteners'],
+                    'thread_size': modification_info['thread_size'],
+                    'wheel_tightening': modification_info['wheel_tightening'],
+                    'fuel': fuel_type.find('h5').text.strip().replace(':', ''),
+                    'trim_levels': modification_info['trim_levels'],
+                    'sizes': modification_info['sizes']
+                })
+    return modifications
+
+
+def index_ids(soup: BeautifulSoup) -> dict:
+    """Maps every id on the page to the tags carrying it, in one walk over the tree."""
+    ids = defaultdict(list)
+    for tag in soup.find_all(id=True):
+        ids[tag['id']].append(tag)
+    return ids
+
+
+def find_panel_content(panels):
+    """The first div.panel-content at or under the given panels, read in place from the page tree."""
+    for panel in panels:
+        if panel.name == 'div' and 'panel-content' in panel.get('class', []):
+            return panel
+        content = panel.find('div', class_='panel-content')
+        if content:
+            return content
+    return None
+
+
+def parse_region_urls(soup: BeautifulSoup) -> list:
+    regions_links = (soup.find('div', class_='market-filter').find_all('a'))
+    return [SITE_URL + region_link['href'] for region_link in regions_links]
+
+
+def parse_modification_info(soup: BeautifulSoup) -> dict:
+    info = {
+        'year_from': None,
+        'year_to': None,
+        'regions': [],
+        'center_bore_hub_bore': None,
+        'bolt_pattern_pcd': None,
+        'wheel_fasteners': None,
+        'thread_size': None,
+        'wheel_tightening': None,
+        'engine': None,
+        'trim_levels': None,
+        'sizes': []
+    }
+    modification_soup = soup.find('div', class_='data-parameters')
+
+    parameters = modification_soup.find_all('li', class_='element-parameter')
+    for param in parameters:
+        param_name = param.find('span', class_='parameter-name').text.strip()
+
+        # Debug output for tracking parsing
+        print(f"Parsing parameter: {param_name}")
+        print(f"Parameter text: {param.get_text(strip=True)}")
+        if 'Engine' in param_name:
+            info['engine'] = get_clean_text(param, split_char=':', index=1)
+
+        elif 'Production' in param_name:
+            years = param.get_text(strip=True).split(':')[-1].replace('[', '').replace(']', '').split('..')
+            info['year_from'] = int(years[0].strip())
+            info['year_to'] = years[1].strip() if len(years) > 1 else 'Present'
+
+        elif 'Sales regions' in param_name:
+            regions = param.find_all('span', class_='cursor-pointer as_link')
+            info['regions'] = [region.get_text(strip=True) for region in regions]
+
+        elif 'Center Bore / Hub Bore' in param_name:
+            center_bore_element = param.find('span', id=True)
+            info['center_bore_hub_bore'] = center_bore_element.get_text(
+                strip=True) if center_bore_element else "unknown"
+
+        elif 'Bolt Pattern (PCD)' in param_name:
+            bolt_pattern = param.get_text(strip=True).split(':')[-1].strip()
+            info['bolt_pattern_pcd'] = bolt_pattern if bolt_pattern else "unknown"
+
+        elif 'Wheel Fasteners' in param_name:
+            wheel_fasteners_element = param.find('div')
+            info['wheel_fasteners'] = wheel_fasteners_element.get_text(strip=True).split(':')[
+                -1].strip() if wheel_fasteners_element else "unknown"
+
+        elif 'Thread Size' in param_name:
+            thread_size_element = param.find('span', id=True)
+            info['thread_size'] = thread_size_element.get_text(strip=True) if thread_size_element else "unknown"
+
+        elif 'Wheel Tightening Torque' in param_name:
+            wheel_tightening_element = param.find('span', id=True)
+            info['wheel_tightening'] = wheel_tightening_element.get_text(
+                strip=True) if wheel_tightening_element else "unknown"
+
+        elif 'Trim levels' in param_name:
+            trim_levels_text = param.get_text(strip=True).split(':')[-1].strip()
+            info['trim_levels'] = trim_levels_text if trim_levels_text else "unknown"
+
+    # Parsing additional details from the table rows
+    table_rows = soup.find('tbody').find_all('tr')
+    for row in table_rows:
+        size_info = (parse_sizes(row))
+        info['sizes'].append(size_info)
+
+    print(info)
+    return info
+
+HELP_TEXT = "Help complete this info"
+
+_whitespace = re.compile(r'\s+')
+
+EMPTY_SIZE = {
+    'tire_front': None,
+    'tire_rear': None,
+    'rim_front': None,
+    'rim_rear': None,
+    'offset_front': None,
+    'offset_rear': None,
+    'backspacing_front': None,
+    'backspacing_rear': None,
+    'weight_front': None,
+    'weight_rear': None,
+    'pressure_front': None,
+    'pressure_rear': None,
+    'load_index_front': None,
+    'load_index_rear': None,
+    'speed_index_front': None,
+    'speed_index_rear': None,
+    'original_equipment': False,
+    'run_flats_tire': False,
+    'recommended_for_winter': False,
+    'extra_load_tire': False,
+}
+
+# Додаткові позначки: data-original-title -> поле
+SIZE_BADGES = {
+    'Original Equipment': 'original_equipment',
+    'Recommended for winter': 'recommended_for_winter',
+    'Extra Load Tire': 'extra_load_tire',
+    'Run-flat tires': 'run_flats_tire',
+}
+
+
+def clean_text(text):
+    return _whitespace.sub(' ', text.strip())
+
+
+def split_front_rear(front, rear):
+    """Front and rear values of a cell, the rear one stripped off the front when it ran into it."""
+    if rear and front and front.endswith(rear):
+        front = front.replace(rear, '').strip()
+    return (front if front else None), (rear if rear else front)
+
+
+def rim_values(cell):
+    front_rim = cell.find('span', class_='js-loaded')
+    if front_rim:
+        front_rim = front_rim.get_text(strip=True)
+    else:
+        front_rim = cell.find('span', class_='masha_index')
+        if front_rim:
+            front_rim = front_rim.find_next_sibling(text=True)
+            if front_rim:
+                front_rim = front_rim.strip()
+    if front_rim == HELP_TEXT:
+        front_rim = None
+
+    rear_rim = cell.find('span', class_='rear-rim-data-full')
+    if rear_rim:
+        rear_rim = rear_rim.get_text(strip=True)
+        if rear_rim == HELP_TEXT:
+            rear_rim = None
+    return split_front_rear(front_rim, rear_rim)
+
+
+def offset_values(cell):
+    texts = [text for text in (span.get_text(strip=True) for span in cell.find_all('span')) if text]
+    return split_front_rear(texts[0] if len(texts) > 0 else None, texts[1] if len(texts) > 1 else None)
+
+
+def metric_values(cell):
+    """Front and rear metric values, written one per line with a <br> between them."""
+    metric_span = cell.find('span', class_='metric')
+    if not metric_span:
+        return None
+    content = []
+    for element in metric_span.children:
+        if isinstance(element, NavigableString):
+            content.append(str(element).strip())
+        elif element.name == 'br':
+            content.append('<br>')
+    values = ''.join(content).split('<br>')
+    front = clean_text(values[0])
+    return front, clean_text(values[1]) if len(values) > 1 else front
+
+
+# Клас комірки td -> (префікс полів, функція, що повертає (front, rear) або None)
+SIZE_COLUMNS = {
+    'data-rim': ('rim', rim_values),
+    'data-offset-range': ('offset', offset_values),
+    'data-backspacing': ('backspacing', metric_values),
+    'data-weight': ('weight', metric_values),
+    'data-pressure': ('pressure', metric_values),
+}
+
+
+def parse_sizes(row) -> dict:
+    size_info = dict(EMPTY_SIZE)
+    tires = []
+    load_indexes = []
+    cells = {}
+
+    # Один прохід по тегах рядка, комірки збираються за класом
+    for tag in row.find_all(True):
+        if tag.name == 'span':
+            badge = SIZE_BADGES.get(tag.get('data-original-title'))
+            if badge:
+                size_info[badge] = True
+            if tag.get('data-tire') is not None:
+                tires.append(tag)
+            if 'tire_load_index' in tag.get('class', ()):
+                load_indexes.append(tag)
+        elif tag.name == 'td':
+            for class_name in tag.get('class', ()):
+                if class_name in SIZE_COLUMNS:
+                    cells.setdefault(class_name, tag)  # Перша комірка, як row.find
+
+    # Одна шина чи індекс означає однакові значення для обох осей
+    if len(tires) in (1, 2):
+        size_info['tire_front'] = tires[0].find('span').get_text(strip=True)
+        size_info['tire_rear'] = tires[-1].find('span').get_text(strip=True)
+    if len(load_indexes) in (1, 2):
+        front_index = load_indexes[0].get_text().strip()
+        rear_index = load_indexes[-1].get_text().strip()
+        size_info['load_index_front'] = front_index[:-1]
+        size_info['speed_index_front'] = front_index[-1]
+        size_info['load_index_rear'] = rear_index[:-1]
+        size_info['speed_index_rear'] = rear_index[-1]
+
+    for class_name, cell in cells.items():
+        prefix, values = SIZE_COLUMNS[class_name]
+        pair = values(cell)
+        if pair is not None:
+            size_info[f'{prefix}_front'], size_info[f'{prefix}_rear'] = pair
+
+    return size_info
+
+
+def get_clean_text(container, split_char=':', index=1):
+    """Extracts and cleans text from the container based on split character and index."""
+    if container:
+        parts = container.get_text(strip=True).split(split_char)
+        if len(parts) > index:
+            return _whitespace.sub(' ', parts[index]).strip()
+    return None
+
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from parity import check_page, run_backend, REFERENCE_BACKEND
+from parsers import BACKENDS
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# (saved page, parser, extra args)
+PAGES = [
+    ('listing.html', 'brands', ()),
+    ('listing.html', 'models', ()),
+    ('listing.html', 'trims', ()),
+    ('trim_type1.html', 'trim_page', (1, 7)),
+    ('trim_type1.html', 'trim_page', (1, 7, True)),
+    ('trim_rows.html', 'trim_page', (3, 7)),
+    ('trim_type2.html', 'trim_page', (2, 7)),
+    ('trim_type2.html', 'trim_page', (2, 7, True)),
+]
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as page:
+        return page.read()
+
+
+@pytest.mark.parametrize('backend', [backend for backend in BACKENDS if backend != REFERENCE_BACKEND])
+@pytest.mark.parametrize('page, name, args', PAGES)
+def test_backend_matches_reference(page, name, args, backend):
+    html = read_fixture(page)
+    expected = run_backend(name, REFERENCE_BACKEND, html, args)
+    assert not isinstance(expected, str), f'{REFERENCE_BACKEND} failed on {page}: {expected}'
+    assert check_page(name, html, args, backends=[backend]) == {}
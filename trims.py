@@ -1,11 +1,11 @@
 import asyncio
 from typing import List
 
-from bs4 import BeautifulSoup
 from pydantic import HttpUrl
 
-from base import fetch_with_retry, get_free_proxy
-from database import create_trim, update_model_processed, SessionLocal
+from base import fetch_if_changed, remember_page, get_free_proxy
+from database import create_trim, update_model_processed, get_trim_urls, enrich_trim, SessionLocal
+from parsers import run_parser
 from proxy import get_free_proxy_async
 from schemas.shemas import TrimCreate
 
@@ -14,61 +14,33 @@ async def fetch_and_insert_trims(
         model_id: int,
         model_url: HttpUrl,
         db,
-        proxy=None
+        proxy=None,
+        session=None,
+        refresh=False,
+        force_subtree=False
 ):
 
-    html = await fetch_with_retry(model_url, proxy=proxy)
-    soup = BeautifulSoup(html, 'html.parser')
-
-    generation_sections = soup.find_all('div', class_='market-generation')
-
-    async def get_trims():
-        for section in generation_sections:
-            link = section.find('a', title=True)
-            if link:
-                title_text = link['title']
-                print(title_text)
-                name_part = title_text.split(':')[-1].strip()
-
-                name = name_part
-                year_from = None
-                year_to = None
-
-                if '[' in name_part and ']' in name_part:
-                    try:
-                        name, years = name_part.split('[')
-                        years = years.strip(']').split('..')
-                        year_from = int(years[0].strip())
-                        year_to = int(years[1].strip()) if len(years) > 1 else None
-                    except ValueError as ve:
-                        print(f"Error parsing years from {name_part}: {ve}")
-                elif '..' in name_part:
-                    try:
-                        name, years = name_part.split('..')
-                        year_from = int(name.split()[-1])
-                        name = ' '.join(name.split()[:-1]).strip()
-                        year_to = int(years.strip())
-                    except ValueError as ve:
-                        print(f"Error parsing years from {name_part}: {ve}")
-                else:
-                    print(f"Invalid format for name and years: {name_part}")
-                    continue
-
-                url = 'https://www.wheel-size.com' + link['href']
-
-                regions = []
-                region_elements = section.find_all('span', class_='badge border border-secondary text-secondary mb-1')
-                for region in region_elements:
-                    regions.append(region.text.strip())
-
-                yield TrimCreate(name=name.strip(), year_from=int(year_from), year_to=str(year_to), url=url, regions=regions)
+    page = await fetch_if_changed(model_url, proxy=proxy, session=session, revalidate=refresh)
+    # Trim urls are not unique in the table, so a recrawl must not insert them twice
+    known_urls = await get_trim_urls(db, model_id)
+    # Only a refresh of a model whose trims are already stored may skip it
+    if refresh and known_urls and not page.changed and not force_subtree:
+        print(f'Model page {model_url} is unchanged, skipping its trims')
+        await update_model_processed(db, model_id)
+        return
 
     try:
-        async for trim in get_trims():
+        trims = [TrimCreate(**record) for record in await run_parser('trims', page.html)]
+        for trim in trims:
+            if str(trim.url) in known_urls:
+                # Trims seeded from the sitemap only know their url
+                await enrich_trim(db, trim, model_id)
+                continue
             try:
                 await create_trim(db, trim, model_id)
             except Exception as e:
                 print(f'Error while creating trim {trim.name}: {e}')
         await update_model_processed(db, model_id)
+        await remember_page(model_url, page)
     except Exception as e:
         print(f'Error while processing trims: {e}')